@@ -0,0 +1,111 @@
+import os
+from datetime import timedelta
+
+# Parquet files written by etl/archive.py (hive layout: period=YYYY-MM-DD/part-*.parquet,
+# one file per archiving run of that period)
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "/archive")
+ARCHIVE_BUCKETS = {"1d": "day", "1mo": "month"}
+# Partial aggregates kept before they are merged: memory stays bounded by the number of groups
+MERGE_EVERY = 64
+AGGREGATES = [("ts", "count"), ("amount", "sum"), ("amount", "min"), ("amount", "max"), ("rejected", "sum")]
+MERGES = [("ts_count", "sum"), ("amount_sum", "sum"), ("amount_min", "min"), ("amount_max", "max"),
+          ("rejected_sum", "sum")]
+
+
+def _dataset():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as fs
+    if not os.path.isdir(ARCHIVE_DIR) or not os.listdir(ARCHIVE_DIR):
+        return None
+    # Memory-mapped reads: pages come from the OS cache instead of being copied.
+    # period stays a string so it compares with the YYYY-MM-DD bounds of _filter
+    return ds.dataset(
+        ARCHIVE_DIR, format="parquet",
+        partitioning=ds.partitioning(pa.schema([("period", pa.string())]), flavor="hive"),
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def _filter(start, end, iface):
+    import pyarrow.dataset as ds
+    expr = None
+    for cond in (
+        # Directory pruning on the partition key; a monthly partition may start up to a month
+        # before `start`
+        ds.field("period") >= f"{start - timedelta(days=31):%Y-%m-%d}" if start is not None else None,
+        ds.field("period") <= f"{end:%Y-%m-%d}" if end is not None else None,
+        ds.field("ts") >= start if start is not None else None,
+        ds.field("ts") < end if end is not None else None,
+        ds.field("iface") == iface if iface is not None else None,
+    ):
+        if cond is not None:
+            expr = cond if expr is None else expr & cond
+    return expr
+
+
+def scan(columns, start=None, end=None, iface=None, batch_size=5000):
+    # Record batches of archived rows, in file order, with row-group pruning on ts/iface
+    dataset = _dataset()
+    if dataset is None:
+        return
+    yield from dataset.to_batches(columns=list(columns), filter=_filter(start, end, iface), batch_size=batch_size)
+
+
+def _partial(batch, keys, bucket):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    table = pa.Table.from_batches([batch])
+    table = table.append_column(
+        "rejected", pc.cast(pc.starts_with(pc.fill_null(table["status"], ""), "REJECT"), pa.int64())
+    )
+    if bucket:
+        table = table.append_column("bucket", pc.floor_temporal(table["ts"], unit=ARCHIVE_BUCKETS[bucket]))
+    if "_all" in keys:
+        table = table.append_column("_all", pa.repeat(pa.scalar(0, pa.int8()), table.num_rows))
+    return table.group_by(keys).aggregate(AGGREGATES)
+
+
+def _merge(partials, keys):
+    import pyarrow as pa
+    merged = pa.concat_tables(partials).group_by(keys).aggregate(MERGES)
+    # ts_count_sum -> ts_count, ...: merged partials keep the shape of a partial
+    return merged.rename_columns([n if n in keys else n.rsplit("_", 1)[0] for n in merged.column_names])
+
+
+def aggregate(start=None, end=None, bucket=None, group_by=()):
+    dataset = _dataset()
+    if dataset is None:
+        return []
+    keys = (["bucket"] if bucket else []) + list(group_by)
+    group_keys = keys or ["_all"]
+
+    # Aggregated batch by batch, partial results merged as they pile up: the scanned range
+    # is never materialized as one table
+    partials = []
+    for batch in dataset.to_batches(columns=["iface", "ts", "status", "amount"], filter=_filter(start, end, None)):
+        if batch.num_rows:
+            partials.append(_partial(batch, group_keys, bucket))
+        if len(partials) >= MERGE_EVERY:
+            partials = [_merge(partials, group_keys)]
+    if not partials:
+        return []
+    merged = _merge(partials, group_keys)
+    if keys:
+        merged = merged.sort_by([(k, "ascending") for k in keys])
+
+    points = []
+    for row in merged.to_pylist():
+        count, amount_sum, rejected = row["ts_count"], row["amount_sum"] or 0.0, row["rejected_sum"]
+        point = {k: row[k] for k in keys}
+        point.update(
+            count=count,
+            amount_sum=amount_sum,
+            amount_min=row["amount_min"],
+            amount_max=row["amount_max"],
+            amount_avg=(amount_sum/count if count>0 else 0),
+            rejected=rejected,
+            reject_rate=(rejected/count*100 if count>0 else 0),
+        )
+        points.append(point)
+    return points
@@ -0,0 +1,132 @@
+import hashlib, os, pickle, threading, time
+from collections import OrderedDict
+from fastapi import Request, Response
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from db import engine
+
+CACHE_BACKEND_URL = os.getenv("CACHE_BACKEND_URL", "memory://")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+# Read endpoints whose data only changes when the ETL commits a batch
+CACHED_PATHS = {"/api/transactions", "/api/stats/summary", "/api/stats/timeseries", "/api/stats/dashboard",
+                "/api/stats/amount_quantiles"}
+
+
+class MemoryBackend:
+    # In-process LRU with per-entry expiry
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RedisBackend:
+    # Shared across API replicas; needs the optional redis package
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._redis.get(key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self._redis.set(key, pickle.dumps(value), ex=ttl)
+
+    def delete(self, key):
+        self._redis.delete(key)
+
+
+def make_backend(url):
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBackend(url)
+    return MemoryBackend(CACHE_MAX_ENTRIES)
+
+
+backend = make_backend(CACHE_BACKEND_URL)
+# None until the ETL epoch is known: responses are not cached under a guessed epoch
+epoch = None
+EPOCH_RETRY_SECONDS = 5
+
+
+def _read_epoch():
+    global epoch
+    with engine.connect() as conn:
+        value = conn.execute(text("SELECT last_value FROM etl_epoch")).scalar()
+    epoch = max(epoch or 0, value)
+
+
+def load_epoch():
+    # Never fails startup: without the database the API serves uncached until the epoch is read
+    # in the background or arrives with a live-feed notification
+    try:
+        _read_epoch()
+    except SQLAlchemyError as e:
+        print(f"ETL epoch unavailable, caching disabled until it is known: {e}")
+        threading.Thread(target=_retry_load_epoch, name="cache-epoch", daemon=True).start()
+
+
+def _retry_load_epoch():
+    while epoch is None:
+        time.sleep(EPOCH_RETRY_SECONDS)
+        try:
+            _read_epoch()
+        except SQLAlchemyError:
+            continue
+        print(f"ETL epoch loaded: {epoch}")
+
+
+def on_etl_commit(payload):
+    # Called by the live feed: a new epoch makes every older key unreachable
+    global epoch
+    if "epoch" in payload:
+        epoch = max(epoch or 0, payload["epoch"])
+
+
+async def middleware(request: Request, call_next):
+    if request.method != "GET" or request.url.path not in CACHED_PATHS or epoch is None:
+        return await call_next(request)
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    key = f"{epoch}:{request.url.path}?{query}"
+    etag = '"' + hashlib.sha1(key.encode()).hexdigest()[:24] + '"'
+
+    entry = backend.get(key)
+    if entry is not None:
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        headers, body = entry
+        return Response(body, headers={**headers, "ETag": etag, "X-Cache": "HIT"})
+
+    response = await call_next(request)
+    if response.status_code != 200:
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+    headers["Cache-Control"] = "no-cache"
+    backend.set(key, (headers, body), CACHE_TTL_SECONDS)
+    return Response(body, headers={**headers, "ETag": etag, "X-Cache": "MISS"})
@@ -0,0 +1,386 @@
+import os, threading
+from datetime import datetime, timedelta
+import numpy as np
+from prometheus_client import Counter, Gauge
+from db import engine
+
+# Most recent HOT_WINDOW_MINUTES of fact_transactions kept in RAM as columns, fed by the
+# ETL notifications; recent listings and aggregates are answered from it, older ranges
+# fall back to SQL. HOT_WINDOW_MINUTES=0 disables it.
+HOT_WINDOW_MINUTES = int(os.getenv("HOT_WINDOW_MINUTES", "60"))
+HOT_WINDOW_MAX_ROWS = int(os.getenv("HOT_WINDOW_MAX_ROWS", "1000000"))
+# Must match etl_job.ID_NAMESPACE_BITS: watermarks are source-local ids
+ID_MASK = (1 << 40) - 1
+COLUMNS = ("id", "iface", "ts", "status", "amount", "etl_loaded_at")
+
+HOT_WINDOW_ROWS = Gauge("api_hot_window_rows", "Rows held in the in-memory hot window")
+HOT_WINDOW_QUERIES = Counter(
+    "api_hot_window_queries_total", "Queries answered from RAM (hit) or sent to SQL (miss)",
+    ["query", "result"],
+)
+
+
+class Vocabulary:
+    # iface/status strings stored as small integer codes; NULL keeps its own code
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value):
+        return self.codes.get(value, -1)
+
+    def coalesced(self):
+        # Code -> grouping code where NULL and '' fall in the same group, as in the rollups
+        empty = self.codes.get("")
+        return np.array(
+            [empty if v is None and empty is not None else c for c, v in enumerate(self.values)] or [0],
+            np.int64,
+        )
+
+
+class HotWindow:
+    def __init__(self, minutes=HOT_WINDOW_MINUTES, max_rows=HOT_WINDOW_MAX_ROWS):
+        self.minutes = minutes
+        self.max_rows = max_rows
+        self.ifaces, self.statuses = Vocabulary(), Vocabulary()
+        # Twice the capacity: appends are amortized O(1) and live rows stay one contiguous slice
+        size = 2 * max_rows
+        self._id = np.empty(size, np.int64)
+        self._ts = np.empty(size, "datetime64[us]")
+        self._iface = np.empty(size, np.int16)
+        self._status = np.empty(size, np.int16)
+        self._amount = np.empty(size, np.float64)
+        self._loaded = np.empty(size, "datetime64[us]")
+        self._start = self._end = 0
+        # Rows with ts >= covered_from are all in the window; None until the first load
+        self.covered_from = None
+        self._newest = None
+        self._watermarks = {}
+        self._pending = None
+        self._reload = False
+        self._lock = threading.Lock()
+        # Liveness of the notification feed (main wires live.feed.alive): without it the
+        # window is frozen and queries go to SQL
+        self.feed_alive = lambda: True
+
+    @property
+    def enabled(self):
+        return self.minutes > 0
+
+    def _arrays(self):
+        return (self._id, self._ts, self._iface, self._status, self._amount, self._loaded)
+
+    # ---------- Sync ----------
+
+    def load(self):
+        # Initial fill: rows and per-source watermarks from one snapshot, then replay the
+        # notifications received meanwhile
+        conn = engine.raw_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            cur.execute("SELECT source, last_id FROM etl_watermark")
+            watermarks = dict(cur.fetchall())
+            cur.execute(f"""
+                SELECT {', '.join(COLUMNS)} FROM fact_transactions
+                WHERE ts >= localtimestamp - make_interval(mins => %s) ORDER BY id
+            """, (self.minutes,))
+            rows = cur.fetchall()
+            cur.execute("SELECT localtimestamp - make_interval(mins => %s)", (self.minutes,))
+            cutoff = cur.fetchone()[0]
+            cur.close()
+            conn.rollback()
+        finally:
+            conn.close()
+        with self._lock:
+            self._start = self._end = 0
+            self._watermarks = watermarks
+            self.covered_from, self._newest = cutoff, None
+            self._append(rows)
+            pending, self._pending = self._pending, None
+        for payload in pending:
+            self.on_etl_commit(payload)
+        print(f"Hot window loaded: {len(rows)} rows since {cutoff}")
+
+    def start(self):
+        # Loads in the background; queries go to SQL until the window is filled
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._pending is not None:
+                # A load already running may have taken its snapshot too early: redo it
+                self._reload = True
+                return
+            self.covered_from, self._pending = None, []
+        threading.Thread(target=self._load_or_disable, name="hot-window-load", daemon=True).start()
+
+    def on_feed_connected(self):
+        # Called by the live feed once LISTEN is active: notifications sent while it was down
+        # are lost, so the window is rebuilt from a snapshot taken after this point
+        self.start()
+
+    def _load_or_disable(self):
+        while True:
+            with self._lock:
+                self._reload = False
+                if self._pending is None:
+                    self.covered_from, self._pending = None, []
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Hot window load failed, serving from SQL: {e}")
+                with self._lock:
+                    self.covered_from, self._pending = None, None
+                return
+            with self._lock:
+                if not self._reload:
+                    return
+
+    def on_etl_commit(self, payload):
+        # Called from the live feed thread; a gap in a source's id range forces a reload
+        source = payload.get("source")
+        if not self.enabled or source is None:
+            return
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(payload)
+                return
+            if self.covered_from is None:
+                return
+            known = self._watermarks.get(source)
+            first, last = payload["from"] & ID_MASK, payload["to"] & ID_MASK
+            # Late ids are listed unless there were too many for the notification
+            late = payload.get("late", [])
+            if known is not None and last <= known and not late:
+                return
+            gap = (known is not None and first > known) or late is None
+        if gap:
+            print(f"Hot window missed rows from {source}, reloading")
+            self.start()
+            return
+        try:
+            rows = self._fetch(payload["from"], payload["to"], late)
+        except Exception as e:
+            print(f"Hot window update failed, reloading: {e}")
+            self.start()
+            return
+        with self._lock:
+            if late:
+                # Late rows may already be in the window (replayed after a load)
+                present = np.isin([r[0] for r in rows], self._id[self._start:self._end])
+                rows = [r for r, dup in zip(rows, present) if not dup]
+            self._watermarks[source] = max(last, known or 0)
+            self._append(rows)
+
+    def _fetch(self, from_id, to_id, late=()):
+        conn = engine.raw_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT {', '.join(COLUMNS)} FROM fact_transactions
+                WHERE (id > %s AND id <= %s) OR id = ANY(%s) ORDER BY id
+            """, (from_id, to_id, list(late)))
+            rows = cur.fetchall()
+            cur.close()
+            conn.rollback()
+            return rows
+        finally:
+            conn.close()
+
+    def _append(self, rows):
+        # Caller holds the lock. The window slides with the newest loaded ts, not the API
+        # clock, so it does not depend on the time zones of the containers
+        rows = [r for r in rows if r[2] is not None and r[2] >= self.covered_from]
+        if rows:
+            newest = max(r[2] for r in rows)
+            self._newest = newest if self._newest is None else max(self._newest, newest)
+        if self._newest is not None:
+            self.covered_from = max(self.covered_from, self._newest - timedelta(minutes=self.minutes))
+        if len(rows) > self.max_rows:
+            dropped = max(r[2] for r in rows[:-self.max_rows])
+            self.covered_from = max(self.covered_from, dropped + timedelta(microseconds=1))
+            rows = rows[-self.max_rows:]
+        n = len(rows)
+        arrays = self._arrays()
+        size = len(self._id)
+        # Evict the prefix older than the window, then the oldest rows beyond capacity
+        expired = self._ts[self._start:self._end] < np.datetime64(self.covered_from, "us")
+        self._start += int(np.argmin(expired)) if not expired.all() else len(expired)
+        overflow = (self._end - self._start) + n - self.max_rows
+        if overflow > 0:
+            evicted = self._ts[self._start:self._start + overflow]
+            self.covered_from = max(self.covered_from, (evicted.max() + np.timedelta64(1, "us")).astype(datetime))
+            self._start += overflow
+        if self._end + n > size:
+            live = self._end - self._start
+            for a in arrays:
+                a[:live] = a[self._start:self._end]
+            self._start, self._end = 0, live
+        if n:
+            columns = list(zip(*rows))
+            end = self._end + n
+            self._id[self._end:end] = columns[0]
+            self._iface[self._end:end] = [self.ifaces.encode(v) for v in columns[1]]
+            self._ts[self._end:end] = columns[2]
+            self._status[self._end:end] = [self.statuses.encode(v) for v in columns[3]]
+            self._amount[self._end:end] = [float(a) if a is not None else np.nan for a in columns[4]]
+            self._loaded[self._end:end] = [v if v is not None else np.datetime64("NaT") for v in columns[5]]
+            self._end = end
+        HOT_WINDOW_ROWS.set(self._end - self._start)
+
+    # ---------- Queries ----------
+
+    def serving(self):
+        return self.covered_from is not None and self.feed_alive()
+
+    def covers(self, start):
+        return self.serving() and start is not None and start >= self.covered_from
+
+    def _mask(self, iface=None, status=None, min_amount=None, max_amount=None, start=None, end=None):
+        s = slice(self._start, self._end)
+        mask = np.ones(self._end - self._start, bool)
+        if iface is not None:
+            mask &= self._iface[s] == self.ifaces.lookup(iface)
+        if status is not None:
+            mask &= self._status[s] == self.statuses.lookup(status)
+        if min_amount is not None:
+            mask &= self._amount[s] >= min_amount
+        if max_amount is not None:
+            mask &= self._amount[s] <= max_amount
+        if start is not None:
+            mask &= self._ts[s] >= np.datetime64(start, "us")
+        if end is not None:
+            mask &= self._ts[s] < np.datetime64(end, "us")
+        return mask
+
+    def recent(self, limit, cursor=None, **filters):
+        # Newest rows by (ts, id) desc, or None when the page may reach rows older than the window
+        rows = self._recent(limit, cursor, **filters)
+        HOT_WINDOW_QUERIES.labels("recent", "miss" if rows is None else "hit").inc()
+        return rows
+
+    def _recent(self, limit, cursor=None, **filters):
+        with self._lock:
+            if not self.serving():
+                return None
+            s = slice(self._start, self._end)
+            mask = self._mask(**filters)
+            # Late rows older than the window may remain in the buffer but are not complete
+            mask &= self._ts[s] >= np.datetime64(self.covered_from, "us")
+            if cursor is not None:
+                c_ts, c_id = np.datetime64(cursor[0], "us"), cursor[1]
+                ts = self._ts[s]
+                mask &= (ts < c_ts) | ((ts == c_ts) & (self._id[s] < c_id))
+            idx = np.flatnonzero(mask)
+            if len(idx) < limit:
+                return None
+            ts = self._ts[s][idx]
+            if len(idx) > limit:
+                # Top-k by ts in linear time, keeping every tie at the boundary
+                kth = np.partition(ts, len(ts) - limit)[len(ts) - limit]
+                keep = ts >= kth
+                idx, ts = idx[keep], ts[keep]
+            order = np.lexsort((self._id[s][idx], ts))[::-1][:limit]
+            idx = idx[order] + self._start
+            return [
+                dict(zip(COLUMNS, row)) for row in zip(
+                    self._id[idx].tolist(),
+                    [self.ifaces.values[c] for c in self._iface[idx]],
+                    self._ts[idx].astype(datetime).tolist(),
+                    [self.statuses.values[c] for c in self._status[idx]],
+                    [None if np.isnan(a) else a for a in self._amount[idx].tolist()],
+                    self._loaded[idx].astype(datetime).tolist(),
+                )
+            ]
+
+    def aggregate(self, start, end=None, bucket=None, origin=None, group_by=()):
+        # Same points as the rollup query of /stats/timeseries, or None if not covered
+        points = self._aggregate(start, end, bucket, origin, group_by)
+        HOT_WINDOW_QUERIES.labels("aggregate", "miss" if points is None else "hit").inc()
+        return points
+
+    def _aggregate(self, start, end, bucket, origin, group_by):
+        with self._lock:
+            if not self.covers(start):
+                return None
+            s = slice(self._start, self._end)
+            mask = self._mask(start=start, end=end)
+            ts, amount = self._ts[s][mask], self._amount[s][mask]
+            iface, status = self._iface[s][mask], self._status[s][mask]
+            keys, names = [], []
+            if bucket is not None:
+                width = np.timedelta64(int(bucket.total_seconds() * 1_000_000), "us")
+                keys.append((ts - np.datetime64(origin, "us")) // width)
+                names.append("bucket")
+            if "iface" in group_by:
+                keys.append(self.ifaces.coalesced()[iface]); names.append("iface")
+            if "status" in group_by:
+                keys.append(self.statuses.coalesced()[status]); names.append("status")
+            rejected_codes = [c for v, c in self.statuses.codes.items() if v and v.startswith("REJECT")]
+            rejected = np.isin(status, rejected_codes)
+
+            if keys:
+                if len(ts) == 0:
+                    return []
+                order = np.lexsort(keys[::-1])
+                sorted_keys = [k[order] for k in keys]
+                change = np.zeros(len(order), bool)
+                change[0] = True
+                for k in sorted_keys:
+                    change[1:] |= k[1:] != k[:-1]
+                starts = np.flatnonzero(change)
+                amounts = amount[order]
+                groups = {
+                    "count": np.diff(np.append(starts, len(order))),
+                    "amount_sum": np.add.reduceat(np.nan_to_num(amounts), starts),
+                    "amount_min": np.fmin.reduceat(amounts, starts),
+                    "amount_max": np.fmax.reduceat(amounts, starts),
+                    "rejected": np.add.reduceat(rejected[order].astype(np.int64), starts),
+                }
+                key_values = [k[starts] for k in sorted_keys]
+            else:
+                groups = {
+                    "count": np.array([len(ts)]),
+                    "amount_sum": np.array([np.nansum(amount)]),
+                    "amount_min": np.array([np.nanmin(amount) if len(ts) else np.nan]),
+                    "amount_max": np.array([np.nanmax(amount) if len(ts) else np.nan]),
+                    "rejected": np.array([int(rejected.sum())]),
+                }
+                key_values = []
+
+        points = []
+        for i in range(len(groups["count"])):
+            point = {}
+            for name, values in zip(names, key_values):
+                if name == "bucket":
+                    point[name] = (np.datetime64(origin, "us") + values[i] * width).astype(datetime)
+                else:
+                    # NULL grouped as '' like the rollups (COALESCE in etl_job.rollup_sql)
+                    vocab = self.ifaces if name == "iface" else self.statuses
+                    point[name] = vocab.values[values[i]] or ""
+            count, amount_sum, rejected_n = int(groups["count"][i]), float(groups["amount_sum"][i]), int(groups["rejected"][i])
+            amount_min, amount_max = float(groups["amount_min"][i]), float(groups["amount_max"][i])
+            point.update(
+                count=count,
+                amount_sum=amount_sum,
+                amount_min=None if np.isnan(amount_min) else amount_min,
+                amount_max=None if np.isnan(amount_max) else amount_max,
+                amount_avg=(amount_sum/count if count>0 else 0),
+                rejected=rejected_n,
+                reject_rate=(rejected_n/count*100 if count>0 else 0),
+            )
+            points.append(point)
+        # Same order as the SQL path (ORDER BY the group keys)
+        points.sort(key=lambda p: tuple(p[n] for n in names))
+        return points
+
+
+
+window = HotWindow()
@@ -0,0 +1,149 @@
+import asyncio, json, select, threading, time, traceback
+import psycopg2
+from db import engine
+from schemas import jsonable
+
+# Channel notified by etl_job.py each time a batch is committed
+LOADED_CHANNEL = "fact_transactions_loaded"
+MAX_PUSH_ROWS = 500
+SUBSCRIBER_QUEUE_SIZE = 100
+RETRY_MIN_DELAY = 1
+RETRY_MAX_DELAY = 60
+# The LISTEN loop wakes up at least every SELECT_TIMEOUT seconds; no wake-up for
+# HEARTBEAT_TIMEOUT means the feed is down or stuck
+SELECT_TIMEOUT = 30
+HEARTBEAT_TIMEOUT = 90
+
+
+# One shared LISTEN connection fanned out to every SSE subscriber
+class LiveFeed:
+    def __init__(self):
+        self._subscribers = set()
+        self._listeners = []
+        self._connect_listeners = []
+        self._loop = None
+        self._thread = None
+        self.connected = False
+        self.last_heartbeat = None
+        self.last_notification = None
+
+    def start(self, loop):
+        if self._thread is not None:
+            return
+        self._loop = loop
+        self._thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+        self._thread.start()
+
+    def subscribe(self):
+        q = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        self._subscribers.discard(q)
+
+    def add_listener(self, callback):
+        # In-process hooks called (from the feed thread) with each ETL notification
+        self._listeners.append(callback)
+
+    def add_connect_listener(self, callback):
+        # Called (from the feed thread) once LISTEN is active on a new connection: anything
+        # notified while disconnected was missed
+        self._connect_listeners.append(callback)
+
+    def alive(self):
+        return (
+            self.connected and self._thread is not None and self._thread.is_alive()
+            and time.monotonic() - self.last_heartbeat < HEARTBEAT_TIMEOUT
+        )
+
+    def _fanout(self, event):
+        for q in list(self._subscribers):
+            try:
+                q.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer: drop this event rather than buffer without bound
+                pass
+
+    def _connect(self):
+        conn = psycopg2.connect(**engine.url.translate_connect_args(username="user", database="dbname"))
+        conn.autocommit = True
+        conn.cursor().execute(f"LISTEN {LOADED_CHANNEL}")
+        return conn
+
+    def _run(self):
+        # The only thread moving the cache epoch and the hot window: any error is logged and
+        # the feed reconnects with a growing delay, it never exits
+        delay = RETRY_MIN_DELAY
+        while True:
+            try:
+                conn = self._connect()
+                delay = RETRY_MIN_DELAY
+                try:
+                    self.connected, self.last_heartbeat = True, time.monotonic()
+                    for callback in self._connect_listeners:
+                        callback()
+                    self._listen(conn)
+                finally:
+                    self.connected = False
+                    conn.close()
+            except psycopg2.OperationalError as e:
+                print(f"Live feed connection lost, retrying in {delay:.0f}s... {e}")
+            except Exception as e:
+                print(f"Live feed failed, reconnecting in {delay:.0f}s: {type(e).__name__}: {e}")
+                traceback.print_exc()
+            time.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX_DELAY)
+
+    def _listen(self, conn):
+        while True:
+            ready = select.select([conn], [], [], SELECT_TIMEOUT) != ([], [], [])
+            self.last_heartbeat = time.monotonic()
+            if not ready:
+                continue
+            conn.poll()
+            notifies = list(conn.notifies)
+            conn.notifies.clear()
+            if notifies:
+                self.last_notification = time.time()
+            for n in notifies:
+                payload = json.loads(n.payload)
+                for callback in self._listeners:
+                    try:
+                        callback(payload)
+                    except Exception:
+                        # A failing listener must not starve the others of notifications
+                        print(f"Live feed listener {getattr(callback, '__qualname__', callback)} failed")
+                        traceback.print_exc()
+                if self._subscribers:
+                    event = self._build_event(conn, payload["from"], payload["to"], payload.get("late") or [])
+                    event["epoch"] = payload.get("epoch")
+                    self._loop.call_soon_threadsafe(self._fanout, event)
+
+    def _build_event(self, conn, from_id, to_id, late=()):
+        # New id range plus the late-committed ids the ETL picked up below it
+        late = list(late)
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, iface, ts, status, amount, etl_loaded_at FROM fact_transactions
+            WHERE (id > %s AND id <= %s) OR id = ANY(%s) ORDER BY id DESC LIMIT %s
+        """, (from_id, to_id, late, MAX_PUSH_ROWS))
+        columns = [c.name for c in cur.description]
+        rows = [dict(zip(columns, map(jsonable, r))) for r in cur.fetchall()]
+        # KPI deltas over the whole batch, even when the pushed rows are capped
+        cur.execute("""
+            SELECT iface, count(*), count(*) FILTER (WHERE status = 'ACCEPTED'),
+                   count(*) FILTER (WHERE status LIKE 'REJECT%%'), COALESCE(sum(amount), 0)
+            FROM fact_transactions WHERE (id > %s AND id <= %s) OR id = ANY(%s) GROUP BY iface
+        """, (from_id, to_id, late))
+        by_iface = {
+            iface: {"count": c, "accepted": a, "rejected": r, "amount_sum": float(s)}
+            for iface, c, a, r, s in cur.fetchall()
+        }
+        cur.close()
+        kpis = {k: sum(v[k] for v in by_iface.values()) for k in ("count", "accepted", "rejected", "amount_sum")}
+        kpis["by_iface"] = by_iface
+        return {"last_id": to_id, "rows": rows, "kpis": kpis}
+
+
+feed = LiveFeed()
@@ -1,11 +1,33 @@
+import asyncio
 from fastapi import FastAPI
 # from .routes import transactions, stats
 
-from routes import transactions, stats, auth
+from routes import transactions, stats, auth, health, alerts
+import cache, hotwindow, live, metrics
 
 
 app = FastAPI(title="Monitoring API")
+app.middleware("http")(cache.middleware)
+# Added last so it is outermost and also times cache hits
+app.middleware("http")(metrics.middleware)
+metrics.setup()
+app.add_api_route("/metrics", metrics.metrics_endpoint, include_in_schema=False)
 
 app.include_router(transactions.router, prefix="/api", tags=["transactions"])
 app.include_router(stats.router, prefix="/api", tags=["stats"])
 app.include_router(auth.router, prefix="/api", tags=["auth"])
+app.include_router(alerts.router, prefix="/api", tags=["alerts"])
+app.include_router(health.router, prefix="/api", tags=["health"])
+
+
+@app.on_event("startup")
+async def start_live_feed():
+    cache.load_epoch()
+    # Hot window first: by the time the cache epoch moves, it already holds the new rows
+    live.feed.add_listener(hotwindow.window.on_etl_commit)
+    live.feed.add_listener(cache.on_etl_commit)
+    # The hot window loads once LISTEN is active (and again after each reconnect) and only
+    # answers while the feed is alive
+    hotwindow.window.feed_alive = live.feed.alive
+    live.feed.add_connect_listener(hotwindow.window.on_feed_connected)
+    live.feed.start(asyncio.get_running_loop())
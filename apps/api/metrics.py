@@ -0,0 +1,66 @@
+import time
+from fastapi import Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+import cache, db
+
+REQUEST_LATENCY = Histogram(
+    "api_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route", "status"],
+)
+DB_QUERY_LATENCY = Histogram(
+    "api_db_query_duration_seconds", "Database statement latency",
+    ["engine", "statement"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+
+class PoolCollector:
+    # Pool usage read at scrape time from db.pool_status()
+    def collect(self):
+        gauges = {
+            name: GaugeMetricFamily(f"api_db_pool_{name}", f"Connection pool {name.replace('_', ' ')}", labels=["engine"])
+            for name in ("size", "checked_in", "checked_out", "overflow")
+        }
+        for engine_name, stats in db.pool_status().items():
+            for name, value in stats.items():
+                gauges[name].add_metric([engine_name], value)
+        return list(gauges.values())
+
+
+def _instrument_engine(engine, name):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERY_LATENCY.labels(name, statement.lstrip().split(" ", 1)[0].upper()).observe(elapsed)
+
+
+def setup():
+    _instrument_engine(db.engine, "sync")
+    _instrument_engine(db.async_engine.sync_engine, "async")
+    REGISTRY.register(PoolCollector())
+
+
+async def middleware(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template (/api/transactions), not raw path, to bound cardinality
+    # Cache hits never reach the router, so fall back to their (known) path
+    route = request.scope.get("route")
+    if route is not None:
+        label = route.path
+    elif request.url.path in cache.CACHED_PATHS:
+        label = request.url.path
+    else:
+        label = "unmatched"
+    REQUEST_LATENCY.labels(request.method, label, response.status_code).observe(time.perf_counter() - started)
+    return response
+
+
+def metrics_endpoint():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
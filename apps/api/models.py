@@ -1,16 +1,65 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime
 from db import Base
 
 
 class FactTransaction(Base):
     __tablename__ = "fact_transactions"
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(BigInteger, primary_key=True, index=True)
     iface = Column(String, index=True)
     ts = Column(DateTime)
     status = Column(String)
     amount = Column(Float)
     etl_loaded_at = Column(DateTime)
 
+# Rollups maintained by the ETL, keyed by (bucket, iface, status)
+class _TransactionRollup:
+    bucket = Column(DateTime, primary_key=True)
+    iface = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)
+    tx_count = Column(BigInteger)
+    amount_sum = Column(Float)
+    amount_min = Column(Float)
+    amount_max = Column(Float)
+
+class AggTransactionMinute(_TransactionRollup, Base):
+    __tablename__ = "agg_transactions_minute"
+
+class AggTransactionHour(_TransactionRollup, Base):
+    __tablename__ = "agg_transactions_hour"
+
+# All-time totals per (iface, status), split over a few shard rows per key (see etl_job.totals_sql)
+class AggTransactionTotal(Base):
+    __tablename__ = "agg_transactions_total"
+    shard = Column(Integer, primary_key=True)
+    iface = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)
+    tx_count = Column(BigInteger)
+    amount_sum = Column(Float)
+    amount_min = Column(Float)
+    amount_max = Column(Float)
+
+# Mergeable amount quantile sketch: counts per log-spaced amount index (see etl_job.sketch_sql)
+class AggAmountSketchHour(Base):
+    __tablename__ = "agg_amount_sketch_hour"
+    bucket = Column(DateTime, primary_key=True)
+    iface = Column(String, primary_key=True)
+    idx = Column(Integer, primary_key=True)
+    tx_count = Column(BigInteger)
+
+# Reject-rate alerts raised by the ETL's streaming detector
+class AnomalyAlert(Base):
+    __tablename__ = "anomaly_alerts"
+    id = Column(BigInteger, primary_key=True)
+    detected_at = Column(DateTime)
+    window_end = Column(DateTime)
+    iface = Column(String)
+    status = Column(String)
+    rate = Column(Float)
+    baseline = Column(Float)
+    zscore = Column(Float)
+    tx_count = Column(Integer)
+    window_total = Column(Integer)
+
 # User model for authentication
 class User(Base):
     __tablename__ = "users"
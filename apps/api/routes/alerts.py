@@ -0,0 +1,23 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+import models, schemas
+from db import get_db
+
+router = APIRouter()
+
+@router.get("/alerts", response_model=List[schemas.AnomalyAlert])
+def get_alerts(
+    iface: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+):
+    # Newest first; pollers pass the last id they saw to get only new alerts
+    a = models.AnomalyAlert
+    q = db.query(a)
+    if iface is not None:
+        q = q.filter(a.iface == iface)
+    if after_id is not None:
+        q = q.filter(a.id > after_id)
+    return q.order_by(a.id.desc()).limit(limit).all()
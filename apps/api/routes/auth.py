@@ -1,16 +1,28 @@
+import asyncio, os, threading
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 import models, schemas
-from db import get_db
+from cache import MemoryBackend
+from db import get_async_db
 
 SECRET_KEY = "your_secret_key_here"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+# bcrypt runs on a bounded pool; beyond HASH_QUEUE_LIMIT waiting calls we answer 503
+HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "4"))
+HASH_QUEUE_LIMIT = int(os.getenv("AUTH_HASH_QUEUE_LIMIT", "32"))
+USER_CACHE_TTL_SECONDS = int(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+hash_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE_LIMIT)
+user_cache = MemoryBackend(max_entries=10000)
 router = APIRouter()
 
 # Utility functions
@@ -21,6 +33,25 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def run_hashing(fn, *args):
+    if not hash_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication is busy, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        return await asyncio.get_running_loop().run_in_executor(hash_pool, fn, *args)
+    finally:
+        hash_slots.release()
+
+async def find_user(db: AsyncSession, username: str):
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalars().first()
+
+def invalidate_user(username: str):
+    user_cache.delete(username)
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -29,15 +60,16 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 
 # Registration endpoint
 @router.post("/register", response_model=schemas.User)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await find_user(db, user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await run_hashing(get_password_hash, user.password)
     new_user = models.User(username=user.username, hashed_password=hashed_password, role=user.role)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    invalidate_user(new_user.username)
     return new_user
 
 
@@ -49,9 +81,9 @@ class LoginRequest(BaseModel):
 
 # Login endpoint
 @router.post("/login")
-def login(form_data: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await find_user(db, form_data.username)
+    if not user or not await run_hashing(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
     access_token = create_access_token(data={"sub": user.username, "role": user.role})
     return {"access_token": access_token, "token_type": "bearer", "role": user.role}
@@ -60,7 +92,7 @@ def login(form_data: LoginRequest, db: Session = Depends(get_db)):
 from fastapi.security import OAuth2PasswordBearer
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -73,19 +105,24 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == username).first()
+    # The token is still verified above; only the users lookup is cached
+    user = user_cache.get(username)
     if user is None:
-        raise credentials_exception
+        db_user = await find_user(db, username)
+        if db_user is None:
+            raise credentials_exception
+        user = schemas.User.from_orm(db_user)
+        user_cache.set(username, user, USER_CACHE_TTL_SECONDS)
     return user
 
 # Example protected endpoint
 @router.get("/me", response_model=schemas.User)
-def read_users_me(current_user: models.User = Depends(get_current_user)):
+def read_users_me(current_user: schemas.User = Depends(get_current_user)):
     return current_user
 
 # Example admin-only endpoint
 @router.get("/admin")
-def admin_only(current_user: models.User = Depends(get_current_user)):
+def admin_only(current_user: schemas.User = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not enough permissions")
     return {"msg": "Welcome, admin!"}
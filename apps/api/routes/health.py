@@ -0,0 +1,8 @@
+from fastapi import APIRouter
+import db
+
+router = APIRouter()
+
+@router.get("/health")
+def health():
+    return {"status": "ok", "pool": db.pool_status()}
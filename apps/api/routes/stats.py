@@ -1,19 +1,217 @@
-from fastapi import APIRouter, Depends
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-import models
-from db import get_db
+from sqlalchemy import func, select
+import archive, hotwindow, models
+from db import get_async_db, get_db
 
 router = APIRouter()
 
+BUCKETS = {
+    "1m": timedelta(minutes=1),
+    "5m": timedelta(minutes=5),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+GROUP_COLUMNS = ("iface", "status")
+# Buckets per series: (to - from) / bucket beyond this is rejected, sub-day buckets need `from`
+MAX_BUCKETS = int(os.getenv("TIMESERIES_MAX_BUCKETS", "1500"))
+BUCKET_ORIGIN = datetime(2000, 1, 1)
+# Must match the ETL's SKETCH_RELATIVE_ACCURACY, which built the stored indexes
+SKETCH_ACCURACY = float(os.getenv("SKETCH_RELATIVE_ACCURACY", "0.01"))
+SKETCH_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+SKETCH_ZERO_INDEX = -32768
+DEFAULT_QUANTILES = [0.5, 0.95, 0.99]
+
 @router.get("/stats/summary")
-def get_summary(db: Session = Depends(get_db)):
-    total = db.query(func.count(models.FactTransaction.id)).scalar()
-    accepted = db.query(func.count()).filter(models.FactTransaction.status=="ACCEPTED").scalar()
-    rejected = db.query(func.count()).filter(models.FactTransaction.status.like("REJECT%")).scalar()
+async def get_summary(db: AsyncSession = Depends(get_async_db)):
+    # Reads the all-time totals rollup: a few rows whatever the history kept
+    h = models.AggTransactionTotal
+    result = await db.execute(select(
+        func.coalesce(func.sum(h.tx_count), 0),
+        func.coalesce(func.sum(h.tx_count).filter(h.status == "ACCEPTED"), 0),
+        func.coalesce(func.sum(h.tx_count).filter(h.status.like("REJECT%")), 0),
+    ))
+    total, accepted, rejected = result.one()
+    total, accepted, rejected = int(total), int(accepted), int(rejected)
     return {
         "total": total,
         "accepted": accepted,
         "rejected": rejected,
         "reject_rate": (rejected/total*100 if total>0 else 0)
     }
+
+def _rollup_for(bucket, start, end):
+    # Minute rollup for sub-hour buckets or window bounds, hourly rollup otherwise
+    if bucket in ("1m", "5m"):
+        return models.AggTransactionMinute
+    if any(t is not None and (t.minute or t.second or t.microsecond) for t in (start, end)):
+        return models.AggTransactionMinute
+    return models.AggTransactionHour
+
+@router.get("/stats/timeseries")
+def get_timeseries(
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    bucket: Optional[str] = None,
+    group_by: List[str] = Query([]),
+    db: Session = Depends(get_db),
+):
+    if bucket is not None and bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(BUCKETS)}")
+    unknown = set(group_by) - set(GROUP_COLUMNS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group by {', '.join(sorted(unknown))}")
+    if bucket is not None:
+        width = BUCKETS[bucket]
+        if start is None and width < timedelta(days=1):
+            raise HTTPException(status_code=400, detail=f"from is required with bucket={bucket}")
+        if start is not None and ((end or datetime.now(start.tzinfo)) - start) / width > MAX_BUCKETS:
+            raise HTTPException(
+                status_code=400, detail=f"at most {MAX_BUCKETS} buckets per series, use a larger bucket or range"
+            )
+
+    # Ranges inside the hot window are aggregated from RAM, exact to the row
+    points = hotwindow.window.aggregate(
+        start, end, BUCKETS.get(bucket), BUCKET_ORIGIN, [c for c in GROUP_COLUMNS if c in group_by]
+    )
+    if points is not None:
+        return points
+
+    r = _rollup_for(bucket, start, end)
+    keys = []
+    if bucket:
+        keys.append(func.date_bin(BUCKETS[bucket], r.bucket, BUCKET_ORIGIN).label("bucket"))
+    keys += [getattr(r, c).label(c) for c in GROUP_COLUMNS if c in group_by]
+
+    # One GROUP BY with FILTER computes every KPI of every point
+    q = db.query(
+        *keys,
+        func.coalesce(func.sum(r.tx_count), 0).label("count"),
+        func.coalesce(func.sum(r.amount_sum), 0).label("amount_sum"),
+        func.min(r.amount_min).label("amount_min"),
+        func.max(r.amount_max).label("amount_max"),
+        func.coalesce(func.sum(r.tx_count).filter(r.status.like("REJECT%")), 0).label("rejected"),
+    )
+    if start is not None:
+        q = q.filter(r.bucket >= start)
+    if end is not None:
+        q = q.filter(r.bucket < end)
+    if keys:
+        q = q.group_by(*keys).order_by(*keys)
+
+    points = []
+    for row in q:
+        point = row._asdict()
+        count, amount_sum, rejected = int(point["count"]), float(point["amount_sum"]), int(point["rejected"])
+        point.update(
+            count=count,
+            amount_sum=amount_sum,
+            amount_avg=(amount_sum/count if count>0 else 0),
+            rejected=rejected,
+            reject_rate=(rejected/count*100 if count>0 else 0),
+        )
+        points.append(point)
+    return points
+
+@router.get("/stats/dashboard")
+def get_dashboard(window_minutes: int = Query(60, ge=1, le=1440), db: Session = Depends(get_db)):
+    # Compact dashboard payload: all-time iface x status breakdown (totals rollup) plus a
+    # per-minute timeline
+    h, m = models.AggTransactionTotal, models.AggTransactionMinute
+    breakdown = [
+        {"iface": iface, "status": status, "count": int(count), "amount_sum": float(amount_sum)}
+        for iface, status, count, amount_sum in db.query(
+            h.iface, h.status, func.sum(h.tx_count), func.sum(h.amount_sum)
+        ).group_by(h.iface, h.status)
+    ]
+    timeline = [
+        {"bucket": bucket, "status": status, "count": int(count)}
+        for bucket, status, count in db.query(m.bucket, m.status, func.sum(m.tx_count))
+        .filter(m.bucket >= func.localtimestamp() - timedelta(minutes=window_minutes))
+        .group_by(m.bucket, m.status)
+        .order_by(m.bucket)
+    ]
+    total = sum(b["count"] for b in breakdown)
+    accepted = sum(b["count"] for b in breakdown if b["status"] == "ACCEPTED")
+    rejected = sum(b["count"] for b in breakdown if b["status"].startswith("REJECT"))
+    amount_sum = sum(b["amount_sum"] for b in breakdown)
+    return {
+        "totals": {
+            "total": total,
+            "accepted": accepted,
+            "rejected": rejected,
+            "reject_rate": (rejected/total*100 if total>0 else 0),
+            "amount_sum": amount_sum,
+            "amount_avg": (amount_sum/total if total>0 else 0),
+        },
+        "by_iface_status": breakdown,
+        "timeline": timeline,
+    }
+
+def _sketch_quantiles(counts, quantiles):
+    # counts: [(idx, n)] sorted by idx; returns the estimate for each quantile
+    total = sum(n for _, n in counts)
+    values = []
+    for q in quantiles:
+        rank, seen = q * (total - 1), 0
+        for idx, n in counts:
+            seen += n
+            if seen > rank:
+                break
+        # Midpoint of (gamma^(idx-1), gamma^idx]: within SKETCH_ACCURACY of any value in the bucket
+        values.append(0.0 if idx == SKETCH_ZERO_INDEX else 2 * SKETCH_GAMMA ** idx / (SKETCH_GAMMA + 1))
+    return values
+
+@router.get("/stats/amount_quantiles")
+def get_amount_quantiles(
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    iface: Optional[str] = None,
+    q: List[float] = Query(DEFAULT_QUANTILES),
+    db: Session = Depends(get_db),
+):
+    # Hourly sketches merged on demand: cost depends on the number of buckets, not of rows
+    if any(not 0 <= x <= 1 for x in q):
+        raise HTTPException(status_code=400, detail="q must be between 0 and 1")
+    s = models.AggAmountSketchHour
+    query = db.query(s.iface, s.idx, func.sum(s.tx_count))
+    if start is not None:
+        query = query.filter(s.bucket >= start)
+    if end is not None:
+        query = query.filter(s.bucket < end)
+    if iface is not None:
+        query = query.filter(s.iface == iface)
+    merged, overall = {}, {}
+    for row_iface, idx, n in query.group_by(s.iface, s.idx):
+        merged.setdefault(row_iface, []).append((idx, int(n)))
+        overall[idx] = overall.get(idx, 0) + int(n)
+    if iface is None and merged:
+        merged["ALL"] = list(overall.items())
+
+    results = []
+    for name, counts in sorted(merged.items()):
+        counts.sort()
+        values = _sketch_quantiles(counts, q)
+        point = {"iface": name, "count": sum(n for _, n in counts)}
+        point.update({f"p{x * 100:g}": v for x, v in zip(q, values)})
+        results.append(point)
+    return {"relative_accuracy": SKETCH_ACCURACY, "quantiles": results}
+
+@router.get("/stats/archive")
+def get_archive_stats(
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    bucket: Optional[str] = None,
+    group_by: List[str] = Query([]),
+):
+    # Same KPIs as /stats/timeseries, computed from the Parquet archive (cold history)
+    if bucket is not None and bucket not in archive.ARCHIVE_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(archive.ARCHIVE_BUCKETS)}")
+    unknown = set(group_by) - set(GROUP_COLUMNS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group by {', '.join(sorted(unknown))}")
+    return archive.aggregate(start, end, bucket, [c for c in GROUP_COLUMNS if c in group_by])
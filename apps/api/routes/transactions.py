@@ -1,10 +1,179 @@
-from fastapi import APIRouter, Depends
+import asyncio, base64, csv, io, itertools, json
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
-import models, schemas
-from db import get_db
+import archive, hotwindow, live, models, schemas
+from db import engine, get_db
 
 router = APIRouter()
 
+MAX_PAGE_SIZE = 1000
+EXPORT_COLUMNS = ("id", "iface", "ts", "status", "amount", "etl_loaded_at")
+EXPORT_CHUNK_ROWS = 5000
+STREAM_KEEPALIVE_SECONDS = 15
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+def encode_cursor(ts: datetime, id: int) -> str:
+    return base64.urlsafe_b64encode(f"{ts.isoformat()}|{id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        ts, id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/transactions", response_model=list[schemas.Transaction])
-def get_transactions(limit: int = 10, db: Session = Depends(get_db)):
-    return db.query(models.FactTransaction).order_by(models.FactTransaction.ts.desc()).limit(limit).all()
+def get_transactions(
+    response: Response,
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    iface: Optional[str] = None,
+    status: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    db: Session = Depends(get_db),
+):
+    # Recent pages come from the in-memory hot window when it holds the whole page
+    rows = hotwindow.window.recent(
+        limit, decode_cursor(cursor) if cursor is not None else None,
+        iface=iface, status=status, min_amount=min_amount, max_amount=max_amount, start=start, end=end,
+    )
+    if rows is not None:
+        if len(rows) == limit:
+            response.headers["X-Next-Cursor"] = encode_cursor(rows[-1]["ts"], rows[-1]["id"])
+        return rows
+
+    t = models.FactTransaction
+    q = db.query(t)
+    if iface is not None:
+        q = q.filter(t.iface == iface)
+    if status is not None:
+        q = q.filter(t.status == status)
+    if min_amount is not None:
+        q = q.filter(t.amount >= min_amount)
+    if max_amount is not None:
+        q = q.filter(t.amount <= max_amount)
+    if start is not None:
+        q = q.filter(t.ts >= start)
+    if end is not None:
+        q = q.filter(t.ts < end)
+    if cursor is not None:
+        # Keyset: resume strictly after the last (ts, id) of the previous page
+        q = q.filter(tuple_(t.ts, t.id) < tuple_(*decode_cursor(cursor)))
+    rows = q.order_by(t.ts.desc(), t.id.desc()).limit(limit).all()
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].ts, rows[-1].id)
+    return rows
+
+def _export_chunks(iface, start, end):
+    # Server-side cursor on a raw DBAPI connection: no ORM objects, bounded memory
+    clauses, params = [], []
+    if iface is not None:
+        clauses.append("iface = %s"); params.append(iface)
+    if start is not None:
+        clauses.append("ts >= %s"); params.append(start)
+    if end is not None:
+        clauses.append("ts < %s"); params.append(end)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor(name="transactions_export")
+        cur.itersize = EXPORT_CHUNK_ROWS
+        cur.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM fact_transactions {where} ORDER BY ts, id", params)
+        while True:
+            rows = cur.fetchmany(EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            yield rows
+        cur.close()
+    finally:
+        conn.rollback()
+        conn.close()
+
+def _archive_chunks(iface, start, end):
+    for batch in archive.scan(EXPORT_COLUMNS, start, end, iface, batch_size=EXPORT_CHUNK_ROWS):
+        yield list(zip(*(batch.column(c).to_pylist() for c in EXPORT_COLUMNS)))
+
+def _ndjson(chunks):
+    for rows in chunks:
+        yield "".join(json.dumps(dict(zip(EXPORT_COLUMNS, map(schemas.jsonable, r)))) + "\n" for r in rows)
+
+def _csv(chunks):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buf.getvalue()
+        buf.seek(0); buf.truncate()
+    yield buf.getvalue()
+
+def _arrow(chunks):
+    import pyarrow as pa
+    schema = pa.schema([
+        ("id", pa.int64()), ("iface", pa.string()), ("ts", pa.timestamp("us")),
+        ("status", pa.string()), ("amount", pa.float64()), ("etl_loaded_at", pa.timestamp("us")),
+    ])
+    buf = io.BytesIO()
+    with pa.ipc.new_stream(buf, schema) as writer:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            columns[4] = [float(a) if a is not None else None for a in columns[4]]
+            writer.write_batch(pa.record_batch(
+                [pa.array(c, type=f.type) for c, f in zip(columns, schema)], schema=schema
+            ))
+            # One IPC message per chunk, flushed to the client right away
+            yield buf.getvalue()
+            buf.seek(0); buf.truncate()
+    yield buf.getvalue()
+
+@router.get("/transactions/export")
+def export_transactions(
+    format: str = "ndjson",
+    iface: Optional[str] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    include_archive: bool = False,
+):
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_MEDIA_TYPES)}")
+    writers = {"ndjson": _ndjson, "csv": _csv, "arrow": _arrow}
+    chunks = _export_chunks(iface, start, end)
+    if include_archive:
+        # Archived rows first, in file order, then live rows by (ts, id). A period re-created
+        # after it was archived has rows on both sides: the export is not ordered by ts overall
+        chunks = itertools.chain(_archive_chunks(iface, start, end), chunks)
+    return StreamingResponse(
+        writers[format](chunks),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=transactions.{format}"},
+    )
+
+@router.get("/transactions/stream")
+async def stream_transactions(request: Request):
+    # Server-sent events: new rows and KPI deltas from the shared live feed
+    q = live.feed.subscribe()
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(q.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: transactions\ndata: {json.dumps(event)}\n\n"
+        finally:
+            live.feed.unsubscribe(q)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
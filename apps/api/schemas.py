@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
+from decimal import Decimal
 
 
 class Transaction(BaseModel):
@@ -13,6 +14,21 @@ class Transaction(BaseModel):
     class Config:
         orm_mode = True
 
+class AnomalyAlert(BaseModel):
+    id: int
+    detected_at: datetime
+    window_end: datetime
+    iface: str
+    status: str
+    rate: float
+    baseline: float
+    zscore: float
+    tx_count: int
+    window_total: int
+
+    class Config:
+        orm_mode = True
+
 # User schema for authentication
 class UserBase(BaseModel):
     username: str
@@ -25,3 +41,11 @@ class User(UserBase):
     id: int
     class Config:
         orm_mode = True
+
+# Plain JSON values for the streaming endpoints, which bypass Pydantic
+def jsonable(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
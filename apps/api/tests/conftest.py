@@ -0,0 +1,4 @@
+import os, sys
+
+# API modules import each other as top-level modules (see Dockerfile.api: COPY apps/api /app)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
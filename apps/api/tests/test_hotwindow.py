@@ -0,0 +1,364 @@
+import random, time
+from datetime import datetime, timedelta
+import pytest
+import hotwindow
+from hotwindow import COLUMNS, HotWindow
+
+# Synthetic fact_transactions rows and ETL notifications, checked against brute force over
+# every row of the fake table: the window must either answer exactly or return None
+NOW = datetime(2024, 3, 1, 12, 0)
+IFACES = ("GAB", "TPE", "WEB", None, "")
+STATUSES = ("OK", "OK", "REJECT_TECH", "REJECT_FUNC", None)
+FILTERS = ({}, {"iface": "GAB"}, {"status": "REJECT_TECH"}, {"iface": "WEB", "status": "OK"},
+           {"min_amount": 100.0, "max_amount": 300.0}, {"iface": "UNKNOWN"})
+BUCKETS = (None, timedelta(minutes=1), timedelta(minutes=5))
+GROUP_BYS = ((), ("iface",), ("iface", "status"))
+
+
+class FakeTable:
+    # fact_transactions + etl_watermark, answering the queries HotWindow sends
+    def __init__(self):
+        self.rows = {}
+        self.watermarks = {}
+        self.now = NOW
+
+    def raw_connection(self):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, table):
+        self.table = table
+
+    def cursor(self):
+        return FakeCursor(self.table)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, table):
+        self.table = table
+        self.result = []
+
+    def execute(self, sql, params=()):
+        table = self.table
+        if "etl_watermark" in sql:
+            self.result = list(table.watermarks.items())
+        elif "ANY" in sql:
+            lo, hi, late = params
+            self.result = sorted(r for r in table.rows.values() if lo < r[0] <= hi or r[0] in late)
+        elif "FROM fact_transactions" in sql:
+            cutoff = table.now - timedelta(minutes=params[0])
+            self.result = sorted(r for r in table.rows.values() if r[2] >= cutoff)
+        elif "localtimestamp" in sql:
+            self.result = [(table.now - timedelta(minutes=params[0]),)]
+        else:
+            self.result = []
+
+    def fetchall(self):
+        return self.result
+
+    def fetchone(self):
+        return self.result[0]
+
+    def close(self):
+        pass
+
+
+class Source:
+    # One ETL source: namespaced ids, watermark and notifications as etl_job.load_new sends them
+    def __init__(self, table, name, namespace, rng):
+        self.table, self.name, self.namespace, self.rng = table, name, namespace, rng
+        self.last_id = 0
+
+    def id(self, local_id):
+        return (self.namespace << 40) | local_id
+
+    def insert(self, local_id, ts):
+        rng = self.rng
+        amount = None if rng.random() < 0.05 else round(rng.uniform(1, 500), 2)
+        self.table.rows[self.id(local_id)] = (
+            self.id(local_id), rng.choice(IFACES), ts, rng.choice(STATUSES), amount, ts,
+        )
+
+    def reserve(self, n):
+        # Ids taken by source transactions that commit later
+        ids = list(range(self.last_id + 1, self.last_id + n + 1))
+        self.last_id += n
+        return ids
+
+    def commit(self, window, timestamps, notify=True, late=None):
+        start = self.last_id
+        for ts in timestamps:
+            self.last_id += 1
+            self.insert(self.last_id, ts)
+        for local_id, ts in (late or {}).items():
+            self.insert(local_id, ts)
+        self.table.watermarks[self.name] = self.last_id
+        if notify:
+            window.on_etl_commit({
+                "source": self.name, "from": self.id(start), "to": self.id(self.last_id),
+                "late": [self.id(i) for i in sorted(late or {})], "count": len(timestamps), "epoch": 0,
+            })
+
+
+def reference_recent(rows, limit, cursor=None, iface=None, status=None, min_amount=None, max_amount=None):
+    keep = [
+        r for r in rows
+        if (iface is None or r[1] == iface) and (status is None or r[3] == status)
+        and (min_amount is None or (r[4] is not None and r[4] >= min_amount))
+        and (max_amount is None or (r[4] is not None and r[4] <= max_amount))
+        and (cursor is None or (r[2], r[0]) < cursor)
+    ]
+    keep.sort(key=lambda r: (r[2], r[0]), reverse=True)
+    return [dict(zip(COLUMNS, r)) for r in keep[:limit]]
+
+
+def reference_aggregate(rows, start, end, bucket, origin, group_by):
+    groups = {}
+    for r in rows:
+        if r[2] < start or (end is not None and r[2] >= end):
+            continue
+        key = []
+        if bucket is not None:
+            key.append(origin + ((r[2] - origin) // bucket) * bucket)
+        # The rollups read by the SQL fallback store NULL iface/status as ''
+        key += [(r[1] if name == "iface" else r[3]) or "" for name in ("iface", "status") if name in group_by]
+        groups.setdefault(tuple(key), []).append(r)
+    if bucket is None and not group_by:
+        groups.setdefault((), [])
+    names = (["bucket"] if bucket is not None else []) + [n for n in ("iface", "status") if n in group_by]
+    points = []
+    for key in sorted(groups):
+        members = groups[key]
+        amounts = [r[4] for r in members if r[4] is not None]
+        rejected = sum(1 for r in members if (r[3] or "").startswith("REJECT"))
+        count = len(members)
+        point = dict(zip(names, key))
+        point.update(
+            count=count,
+            amount_sum=sum(amounts),
+            amount_min=min(amounts, default=None),
+            amount_max=max(amounts, default=None),
+            amount_avg=(sum(amounts) / count if count > 0 else 0),
+            rejected=rejected,
+            reject_rate=(rejected / count * 100 if count > 0 else 0),
+        )
+        points.append(point)
+    return points
+
+
+def assert_points_equal(got, expected):
+    assert len(got) == len(expected)
+    for g, e in zip(got, expected):
+        assert g.keys() == e.keys()
+        for k in e:
+            if isinstance(e[k], float):
+                assert g[k] == pytest.approx(e[k])
+            else:
+                assert g[k] == e[k], k
+
+
+def check_window(window, table):
+    # Every answer matches brute force; answers are refused only past the covered range
+    rows = list(table.rows.values())
+    covered = window.covered_from
+    assert covered is not None
+    assert window._end - window._start <= window.max_rows
+    ids = window._id[window._start:window._end]
+    assert len(set(ids.tolist())) == len(ids)
+    for filters in FILTERS:
+        in_window = reference_recent([r for r in rows if r[2] >= covered], len(rows), **filters)
+        for limit in (1, 7, 50):
+            got = window.recent(limit, **filters)
+            if limit <= len(in_window):
+                assert got is not None
+            if got is not None:
+                assert got == reference_recent(rows, limit, **filters)
+    for start in (covered, covered + timedelta(seconds=90), covered - timedelta(seconds=1)):
+        for bucket in BUCKETS:
+            for group_by in GROUP_BYS:
+                for end in (None, start + timedelta(minutes=3)):
+                    got = window.aggregate(start, end, bucket, NOW, group_by)
+                    if start < covered:
+                        assert got is None
+                        continue
+                    assert got is not None
+                    assert_points_equal(got, reference_aggregate(rows, start, end, bucket, NOW, group_by))
+
+
+def wait_loaded(window, timeout=5):
+    deadline = time.monotonic() + timeout
+    while window._pending is not None or window.covered_from is None:
+        assert time.monotonic() < deadline, "hot window did not reload"
+        time.sleep(0.01)
+
+
+def window_ids(window):
+    return set(window._id[window._start:window._end].tolist())
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = FakeTable()
+    monkeypatch.setattr(hotwindow, "engine", table)
+    return table
+
+
+def test_recent_and_aggregate_match_reference(table):
+    rng = random.Random(1)
+    a, b = Source(table, "a", 0, rng), Source(table, "b", 1, rng)
+    # History on both sides of the initial cutoff
+    a.commit(None, [NOW - timedelta(seconds=s) for s in range(3600, 0, -20)], notify=False)
+    b.commit(None, [NOW - timedelta(seconds=s) for s in range(3600, 0, -45)], notify=False)
+    window = HotWindow(minutes=30, max_rows=10000)
+    window.start()
+    wait_loaded(window)
+    assert window.covered_from == NOW - timedelta(minutes=30)
+    check_window(window, table)
+
+    for step in range(1, 6):
+        # a runs ahead, b lags two minutes behind; ts are shuffled within each batch
+        newest = NOW + timedelta(minutes=step)
+        a_ts = [newest - timedelta(seconds=rng.randrange(60)) for _ in range(40)]
+        b_ts = [newest - timedelta(minutes=2, seconds=rng.randrange(120)) for _ in range(25)]
+        a.commit(window, a_ts)
+        b.commit(window, b_ts)
+        check_window(window, table)
+    assert window.covered_from == NOW + timedelta(minutes=5) - timedelta(minutes=30)
+
+
+def test_cursor_paging(table):
+    rng = random.Random(2)
+    a, b = Source(table, "a", 0, rng), Source(table, "b", 3, rng)
+    window = HotWindow(minutes=10, max_rows=10000)
+    window.start()
+    wait_loaded(window)
+    for step in range(10):
+        base = NOW + timedelta(minutes=step)
+        # Duplicate ts across sources exercise the id tie-break of the cursor
+        stamps = [base + timedelta(seconds=rng.randrange(0, 60, 5)) for _ in range(30)]
+        a.commit(window, stamps)
+        b.commit(window, stamps[:10])
+    rows = list(table.rows.values())
+
+    for filters in ({}, {"iface": "TPE"}, {"status": "REJECT_FUNC"}):
+        pages, cursor = [], None
+        while True:
+            page = window.recent(25, cursor, **filters)
+            if page is None:
+                break
+            pages += page
+            cursor = (page[-1]["ts"], page[-1]["id"])
+        expected = reference_recent(rows, len(rows), **filters)
+        assert pages == expected[:len(pages)]
+        # Paging stops only when the next page would reach rows older than the window
+        in_window = [p for p in expected if p["ts"] >= window.covered_from]
+        assert len(pages) > len(in_window) - 25
+        assert len(pages) >= 50
+
+
+def test_overflow_eviction(table):
+    rng = random.Random(3)
+    a, b = Source(table, "a", 0, rng), Source(table, "b", 1, rng)
+    window = HotWindow(minutes=60, max_rows=100)
+    window.start()
+    wait_loaded(window)
+    initial = window.covered_from
+    for step in range(30):
+        base = NOW + timedelta(seconds=20 * step)
+        a.commit(window, [base + timedelta(seconds=rng.randrange(20)) for _ in range(15)])
+        b.commit(window, [base - timedelta(seconds=30 + rng.randrange(20)) for _ in range(6)])
+        check_window(window, table)
+    # Capacity, not age, moved the window
+    assert window.covered_from > initial
+    assert window.covered_from > window._newest - timedelta(minutes=60)
+    assert window._end - window._start <= 100
+
+    # One notification larger than the whole window
+    base = NOW + timedelta(minutes=11)
+    a.commit(window, sorted(base + timedelta(milliseconds=rng.randrange(60000)) for _ in range(250)))
+    check_window(window, table)
+    assert window.recent(100) is not None
+
+
+def test_late_rows_below_watermark(table):
+    rng = random.Random(4)
+    a = Source(table, "a", 0, rng)
+    window = HotWindow(minutes=15, max_rows=10000)
+    window.start()
+    wait_loaded(window)
+    a.commit(window, [NOW + timedelta(seconds=s) for s in range(0, 300, 10)])
+    reserved = a.reserve(5)
+    a.commit(window, [NOW + timedelta(seconds=s) for s in range(300, 600, 10)])
+    # The reserved ids commit after the watermark moved past them, with older ts
+    late = {i: NOW + timedelta(seconds=295, microseconds=i) for i in reserved}
+    a.commit(window, [NOW + timedelta(seconds=600)], late=late)
+    check_window(window, table)
+    assert {a.id(i) for i in reserved} <= window_ids(window)
+
+    # Replayed notification (e.g. after a reload): late rows are not appended twice
+    window.on_etl_commit({"source": "a", "from": a.id(a.last_id - 1), "to": a.id(a.last_id),
+                          "late": [a.id(i) for i in reserved], "count": 1, "epoch": 0})
+    check_window(window, table)
+
+
+def test_gap_triggers_reload(table):
+    rng = random.Random(5)
+    a, b = Source(table, "a", 0, rng), Source(table, "b", 1, rng)
+    window = HotWindow(minutes=15, max_rows=10000)
+    window.start()
+    wait_loaded(window)
+    a.commit(window, [NOW + timedelta(seconds=s) for s in range(0, 120, 3)])
+    b.commit(window, [NOW + timedelta(seconds=s) for s in range(0, 120, 7)])
+
+    # A lost notification leaves a gap in a's ids: the next one triggers a reload
+    missed = a.last_id
+    a.commit(window, [NOW + timedelta(seconds=s) for s in range(120, 180, 2)], notify=False)
+    table.now = NOW + timedelta(minutes=3)
+    a.commit(window, [NOW + timedelta(seconds=s) for s in range(180, 200, 2)])
+    wait_loaded(window)
+    check_window(window, table)
+    assert {a.id(missed + 1), a.id(a.last_id)} <= window_ids(window)
+
+    # Too many late rows to be listed in the notification: reload as well
+    reserved = a.reserve(3)
+    b.commit(window, [NOW + timedelta(seconds=s) for s in range(200, 230, 5)])
+    a.commit(window, [NOW + timedelta(seconds=230)], notify=False,
+             late={i: NOW + timedelta(seconds=199) for i in reserved})
+    window.on_etl_commit({"source": "a", "from": a.id(a.last_id - 1), "to": a.id(a.last_id),
+                          "late": None, "count": 4, "epoch": 0})
+    wait_loaded(window)
+    check_window(window, table)
+    assert {a.id(i) for i in reserved} <= window_ids(window)
+
+
+def test_feed_outage_stops_serving_until_reload(table):
+    rng = random.Random(6)
+    a = Source(table, "a", 0, rng)
+    window = HotWindow(minutes=15, max_rows=10000)
+    alive = [True]
+    window.feed_alive = lambda: alive[0]
+    window.on_feed_connected()
+    wait_loaded(window)
+    a.commit(window, [NOW + timedelta(seconds=s) for s in range(0, 120, 3)])
+    assert window.recent(10) is not None
+
+    # Feed down: notifications are lost, the frozen window must not answer
+    alive[0] = False
+    a.commit(window, [NOW + timedelta(seconds=s) for s in range(120, 180, 3)], notify=False)
+    assert window.recent(10) is None
+    assert window.aggregate(window.covered_from, None, None, NOW, ()) is None
+
+    # Reconnected: rebuilt from a fresh snapshot, including what was committed meanwhile
+    alive[0] = True
+    table.now = NOW + timedelta(minutes=3)
+    window.on_feed_connected()
+    wait_loaded(window)
+    check_window(window, table)
+    assert a.id(a.last_id) in window_ids(window)
@@ -1,13 +1,25 @@
+import hashlib, os, threading, time
+STARTED = time.perf_counter()  # durée d'import exposée dans /metrics
 import dash
-from dash import dcc, html, Output, Input, State, dash_table
-import plotly.express as px
+from dash import dcc, html, Output, Input, State, Patch, dash_table
 import plotly.graph_objects as go
 import requests
-import pandas as pd
+from requests.adapters import HTTPAdapter
 import dash.exceptions
+from live_feed import LiveFeed
+import data_cache, metrics
 
 API_URL = "http://api_service:8000/api"
 
+IFACES = ["ATM", "POS", "VISA", "MASTERCARD"]
+STATUSES = ["ACCEPTED", "REJECT_TECH", "REJECT_FUNC"]
+STATUS_COLORS = {"ACCEPTED": "#10B981", "REJECT_TECH": "#EF4444", "REJECT_FUNC": "#F59E0B"}
+# Sans epoch ETL (flux SSE coupé), les données sont rechargées toutes les N secondes
+FALLBACK_REFRESH_EVERY = 8
+DASHBOARD_WINDOW_MINUTES = 60
+TOKEN_CACHE_TTL = 60
+HEALTH_PROBE_INTERVAL = float(os.getenv("DASHBOARD_HEALTH_PROBE_INTERVAL", "15"))
+
 app = dash.Dash(
     __name__,
     title="Supervision Monétique",
@@ -15,34 +27,114 @@ app = dash.Dash(
 )
 
 app.title = "Supervision Monétique"
+metrics.register(app.server)
+
+# Session HTTP partagée : connexions keep-alive réutilisées par tous les callbacks
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"} if token else {}
 
 def check_connectivity():
     try:
-        resp = requests.get(f"{API_URL}/transactions?limit=1", timeout=3)
+        resp = session.get(f"{API_URL}/health", timeout=3)
         resp.raise_for_status()
-        print("API connectivity: OK")
         return True
     except Exception as e:
         print(f"API connectivity failed: {e}")
         return False
 
+# Dernier résultat de la sonde de santé (None tant qu'elle n'a pas tourné)
+api_status = {"reachable": None, "checked_at": None}
+
+def health_probe():
+    # Sonde en arrière-plan : aucun appel réseau à l'import, ni dans les callbacks
+    while True:
+        reachable = check_connectivity()
+        if reachable != api_status["reachable"]:
+            print(f"API connectivity: {'OK' if reachable else 'unreachable'}")
+        api_status.update(reachable=reachable, checked_at=time.time())
+        metrics.API_REACHABLE.set(1 if reachable else 0)
+        time.sleep(HEALTH_PROBE_INTERVAL)
+
 def get_data(limit=100, token=None):
-    headers = {}
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
     try:
-        resp = requests.get(f"{API_URL}/transactions?limit={limit}", timeout=10, headers=headers)
+        resp = session.get(f"{API_URL}/transactions?limit={limit}", timeout=10, headers=auth_headers(token))
         resp.raise_for_status()
-        data = resp.json()
-        df = pd.DataFrame(data)
-        return df
+        return resp.json()
     except requests.exceptions.RequestException as e:
         print(f"Error fetching data: {e}")
-        return pd.DataFrame(columns=["iface", "status", "amount", "ts"])
+        return []
+
+def get_dashboard_stats(token=None):
+    # KPIs pré-agrégés côté API (rollups) : quelques dizaines de points au lieu des lignes brutes
+    try:
+        resp = session.get(f"{API_URL}/stats/dashboard?window_minutes={DASHBOARD_WINDOW_MINUTES}", timeout=10, headers=auth_headers(token))
+        resp.raise_for_status()
+        return resp.json()
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching dashboard stats: {e}")
+        return None
+
+# Lignes poussées par l'API (SSE) : le tableau ne refait plus de requête
+live_feed = LiveFeed(f"{API_URL}/transactions/stream", seed=lambda limit: get_data(limit=limit))
+
+def validate_token(token):
+    try:
+        resp = session.get(f"{API_URL}/me", timeout=5, headers=auth_headers(token))
+        if resp.status_code == 401:
+            return False
+        resp.raise_for_status()
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"Token validation failed: {e}")
+        return None
+
+def token_is_valid(token):
+    # Les données sont partagées entre sessions, mais chaque jeton est vérifié (résultat gardé TOKEN_CACHE_TTL s)
+    key = ("token", hashlib.sha256(token.encode()).hexdigest())
+    return data_cache.get_or_compute(key, lambda: validate_token(token), ttl=TOKEN_CACHE_TTL) is True
+
+def current_epoch():
+    if live_feed.epoch is not None:
+        return f"etl:{live_feed.epoch}"
+    return f"time:{int(time.time() // FALLBACK_REFRESH_EVERY)}"
+
+def is_newer(seen, shown):
+    # Comparaison sur des valeurs communes à tous les workers (epoch de l'ETL, dernier id),
+    # jamais sur le compteur de version propre à chaque processus
+    if not shown or "epoch" not in shown:
+        return True
+    kind, value = seen["epoch"].split(":")
+    shown_kind, shown_value = shown["epoch"].split(":")
+    if kind != shown_kind:
+        return kind == "etl"  # une epoch de l'ETL prime sur le repli horaire
+    if int(value) != int(shown_value):
+        return int(value) > int(shown_value)
+    return shown.get("last_id") is None and seen["last_id"] is not None
+
+def get_view(epoch):
+    # Un seul appel API et un seul calcul des figures par (paramètres, epoch), pour toutes les sessions
+    def compute():
+        stats = get_dashboard_stats()
+        if stats is None:
+            return None
+        return {"kpis": get_metrics(stats), "figures": figure_values(stats)}
+    return data_cache.get_or_compute(("dashboard", f"window_minutes={DASHBOARD_WINDOW_MINUTES}", epoch), compute)
+
+def refresh_loop():
+    # Rafraîchit le cache en arrière-plan : les callbacks ne font en général qu'une lecture
+    while True:
+        try:
+            get_view(current_epoch())
+        except Exception as e:
+            print(f"Dashboard cache refresh failed: {e}")
+        time.sleep(1)
 
 def login_api(username, password):
     try:
-        resp = requests.post(f"{API_URL}/login", json={"username": username, "password": password}, timeout=5)
+        resp = session.post(f"{API_URL}/login", json={"username": username, "password": password}, timeout=5)
         resp.raise_for_status()
         return resp.json().get("access_token", None)
     except Exception as e:
@@ -50,107 +142,75 @@ def login_api(username, password):
         return None
 
 # ---------- Enhanced Figures ----------
-def transactions_by_iface(df):
-    if df.empty:
-        fig = go.Figure()
-        fig.add_annotation(text="No data available", x=0.5, y=0.5, showarrow=False, font_size=16)
-        fig.update_layout(
-            title="Transactions by Interface & Status",
-            template="plotly_white",
-            height=350
-        )
-        return fig
-    
-    fig = px.histogram(
-        df, x="iface", color="status", barmode="group",
-        title="Transactions by Interface & Status",
-        color_discrete_map={
-            'success': '#10B981',
-            'failed': '#EF4444', 
-            'pending': '#F59E0B',
-            'cancelled': '#6B7280'
-        }
-    )
+# Figures construites une seule fois avec des traces fixes ; les rafraîchissements
+# ne font que patcher leurs valeurs (dash.Patch)
+def style_figure(fig, title, height=350):
     fig.update_layout(
+        title=title,
         template="plotly_white",
         title_font_size=16,
         title_font_color="#1F2937",
-        height=350,
+        height=height,
         margin=dict(t=50, b=50, l=50, r=50)
     )
     return fig
 
-def amount_by_iface(df):
-    if df.empty:
-        fig = go.Figure()
-        fig.add_annotation(text="No data available", x=0.5, y=0.5, showarrow=False, font_size=16)
-        fig.update_layout(
-            title="Total Amount by Interface",
-            template="plotly_white",
-            height=350
-        )
-        return fig
-    
-    agg = df.groupby("iface", as_index=False)["amount"].sum()
-    fig = px.bar(
-        agg, x="iface", y="amount", text_auto=True,
-        title="Total Amount by Interface"
-    )
-    fig.update_traces(marker_color='#3B82F6', textposition='outside')
-    fig.update_layout(
-        template="plotly_white",
-        title_font_size=16,
-        title_font_color="#1F2937",
-        height=350,
-        margin=dict(t=50, b=50, l=50, r=50)
-    )
-    return fig
+def transactions_by_iface():
+    fig = go.Figure([
+        go.Bar(name=status, x=IFACES, y=[0] * len(IFACES), marker_color=STATUS_COLORS[status])
+        for status in STATUSES
+    ])
+    fig.update_layout(barmode="group")
+    return style_figure(fig, "Transactions by Interface & Status")
 
-def status_distribution(df):
-    if df.empty:
-        fig = go.Figure()
-        fig.add_annotation(text="No data available", x=0.5, y=0.5, showarrow=False, font_size=16)
-        fig.update_layout(
-            title="Status Distribution",
-            template="plotly_white",
-            height=350
-        )
-        return fig
-    
-    fig = px.pie(
-        df, names="status", title="Status Distribution",
-        hole=0.4,
-        color_discrete_map={
-            'success': '#10B981',
-            'failed': '#EF4444', 
-            'pending': '#F59E0B',
-            'cancelled': '#6B7280'
-        }
-    )
-    fig.update_layout(
-        template="plotly_white",
-        title_font_size=16,
-        title_font_color="#1F2937",
-        height=350,
-        margin=dict(t=50, b=50, l=50, r=50)
-    )
-    return fig
+def amount_by_iface():
+    fig = go.Figure(go.Bar(
+        x=IFACES, y=[0] * len(IFACES), marker_color='#3B82F6',
+        texttemplate="%{y:,.2f}", textposition="outside"
+    ))
+    return style_figure(fig, "Total Amount by Interface")
+
+def status_distribution():
+    fig = go.Figure(go.Pie(
+        labels=STATUSES, values=[0] * len(STATUSES), hole=0.4,
+        marker_colors=[STATUS_COLORS[s] for s in STATUSES], sort=False
+    ))
+    return style_figure(fig, "Status Distribution")
 
-def get_metrics(df):
-    if df.empty:
-        return {"total": 0, "success_rate": 0, "total_amount": 0, "avg_amount": 0}
-    
-    total = len(df)
-    success_count = len(df[df['status'] == 'success']) if 'status' in df.columns else 0
-    success_rate = (success_count / total * 100) if total > 0 else 0
-    total_amount = df['amount'].sum() if 'amount' in df.columns else 0
-    avg_amount = df['amount'].mean() if 'amount' in df.columns and total > 0 else 0
-    
+def transactions_timeline():
+    fig = go.Figure([
+        go.Scatter(name=status, x=[], y=[], mode="lines", line_color=STATUS_COLORS[status])
+        for status in STATUSES
+    ])
+    return style_figure(fig, "Transactions per Minute (last hour)")
+
+def figure_values(stats):
+    counts = {(b["iface"], b["status"]): b for b in stats["by_iface_status"]}
+    value = lambda iface, status, key: counts.get((iface, status), {}).get(key, 0)
+    timeline = {status: [p for p in stats["timeline"] if p["status"] == status] for status in STATUSES}
+    return {
+        "by_iface": [[value(iface, status, "count") for iface in IFACES] for status in STATUSES],
+        "amount": [sum(value(iface, s, "amount_sum") for s in STATUSES) for iface in IFACES],
+        "status": [sum(value(iface, s, "count") for iface in IFACES) for s in STATUSES],
+        "timeline": [([p["bucket"] for p in timeline[s]], [p["count"] for p in timeline[s]]) for s in STATUSES],
+    }
+
+def figure_patches(values):
+    by_iface, amount, status_dist, timeline = Patch(), Patch(), Patch(), Patch()
+    for i in range(len(STATUSES)):
+        by_iface["data"][i]["y"] = values["by_iface"][i]
+        timeline["data"][i]["x"], timeline["data"][i]["y"] = values["timeline"][i]
+    amount["data"][0]["y"] = values["amount"]
+    status_dist["data"][0]["values"] = values["status"]
+    return by_iface, amount, status_dist, timeline
+
+def get_metrics(stats):
+    totals = stats["totals"]
     return {
-        "total": total,
-        "success_rate": success_rate,
-        "total_amount": total_amount,
-        "avg_amount": avg_amount
+        "total": totals["total"],
+        "success_rate": (totals["accepted"] / totals["total"] * 100) if totals["total"] > 0 else 0,
+        "total_amount": totals["amount_sum"],
+        "avg_amount": totals["amount_avg"]
     }
 
 # ---------- Enhanced Layout ----------
@@ -224,21 +284,25 @@ def dashboard_content():
                 html.Button("Logout", id="logout-btn", n_clicks=0, style={"float": "right", "backgroundColor": "#EF4444", "color": "white", "border": "none", "borderRadius": "6px", "padding": "8px 16px", "fontWeight": "600"})
             ]
         ),
-        dcc.Interval(id="refresh", interval=8000, n_intervals=0),
+        dcc.Interval(id="refresh", interval=1000, n_intervals=0),
+        dcc.Store(id="feed-version"),
         html.Div(
             style={"maxWidth": "1400px", "margin": "0 auto", "padding": "0 32px"},
             children=[
                 html.Div(id="metrics-container", style={"display": "grid", "gridTemplateColumns": "repeat(auto-fit, minmax(250px, 1fr))", "gap": "24px", "marginBottom": "32px"}),
                 html.Div([
                     html.Div([
-                        html.Div(dcc.Graph(id="graph-status-dist", style={"height": "350px"}), style={"backgroundColor": "#FFFFFF", "borderRadius": "12px", "boxShadow": "0 1px 3px 0 rgba(0, 0, 0, 0.1)", "padding": "20px"})
+                        html.Div(dcc.Graph(id="graph-status-dist", figure=status_distribution(), style={"height": "350px"}), style={"backgroundColor": "#FFFFFF", "borderRadius": "12px", "boxShadow": "0 1px 3px 0 rgba(0, 0, 0, 0.1)", "padding": "20px"})
                     ], style={"width": "48%", "display": "inline-block", "marginRight": "4%"}),
                     html.Div([
-                        html.Div(dcc.Graph(id="graph-amount", style={"height": "350px"}), style={"backgroundColor": "#FFFFFF", "borderRadius": "12px", "boxShadow": "0 1px 3px 0 rgba(0, 0, 0, 0.1)", "padding": "20px"})
+                        html.Div(dcc.Graph(id="graph-amount", figure=amount_by_iface(), style={"height": "350px"}), style={"backgroundColor": "#FFFFFF", "borderRadius": "12px", "boxShadow": "0 1px 3px 0 rgba(0, 0, 0, 0.1)", "padding": "20px"})
                     ], style={"width": "48%", "display": "inline-block"}),
                 ], style={"marginBottom": "32px"}),
                 html.Div([
-                    html.Div(dcc.Graph(id="graph-transactions", style={"height": "400px"}), style={"backgroundColor": "#FFFFFF", "borderRadius": "12px", "boxShadow": "0 1px 3px 0 rgba(0, 0, 0, 0.1)", "padding": "20px"})
+                    html.Div(dcc.Graph(id="graph-transactions", figure=transactions_by_iface(), style={"height": "400px"}), style={"backgroundColor": "#FFFFFF", "borderRadius": "12px", "boxShadow": "0 1px 3px 0 rgba(0, 0, 0, 0.1)", "padding": "20px"})
+                ], style={"marginBottom": "32px"}),
+                html.Div([
+                    html.Div(dcc.Graph(id="graph-timeline", figure=transactions_timeline(), style={"height": "350px"}), style={"backgroundColor": "#FFFFFF", "borderRadius": "12px", "boxShadow": "0 1px 3px 0 rgba(0, 0, 0, 0.1)", "padding": "20px"})
                 ], style={"marginBottom": "32px"}),
                 html.Div([
                     html.H3("📋 Recent Transactions", style={"fontSize": "24px", "fontWeight": "600", "color": "#1F2937", "marginBottom": "20px"}),
@@ -277,6 +341,7 @@ def dashboard_content():
     Output("main-content", "children"),
     Input("jwt-store", "data"),
 )
+@metrics.timed("show_content")
 def show_content(jwt_data):
     if jwt_data:
         return dashboard_content()
@@ -291,6 +356,7 @@ def show_content(jwt_data):
     [State("login-username", "value"), State("login-password", "value")],
     prevent_initial_call=True
 )
+@metrics.timed("handle_auth")
 def handle_auth(login_clicks, logout_clicks, username, password):
     ctx = dash.callback_context
     if not ctx.triggered:
@@ -311,53 +377,89 @@ def handle_auth(login_clicks, logout_clicks, username, password):
     [Output("graph-transactions", "figure"),
      Output("graph-amount", "figure"),
      Output("graph-status-dist", "figure"),
+     Output("graph-timeline", "figure"),
      Output("transactions-table", "data"),
-     Output("metrics-container", "children")],
+     Output("metrics-container", "children"),
+     Output("feed-version", "data")],
     [Input("refresh", "n_intervals")],
-    [State("jwt-store", "data")]
+    [State("jwt-store", "data"), State("feed-version", "data")]
 )
-def update_dashboard(n, token):
+@metrics.timed("update_dashboard")
+def update_dashboard(n, token, seen_version):
     if not token:
         raise dash.exceptions.PreventUpdate
-    df = get_data(limit=100, token=token)
-    metrics = get_metrics(df)
+    if not token_is_valid(token):
+        raise dash.exceptions.PreventUpdate
+    # Rien de plus récent que le dernier rendu de cette session : pas de re-rendu. Les requêtes
+    # alternent entre workers, qui n'ont pas tous reçu le même lot au même moment
+    _, rows = live_feed.snapshot()
+    seen = {"epoch": current_epoch(), "last_id": rows[0]["id"] if rows else None}
+    if not is_newer(seen, seen_version):
+        raise dash.exceptions.PreventUpdate
+    view = get_view(seen["epoch"])
+    if view is None:
+        raise dash.exceptions.PreventUpdate
+    kpis = view["kpis"]
     metrics_cards = [
         html.Div([
             html.Div([
-                html.H3(f"{metrics['total']:,}", style={"margin": "0", "fontSize": "28px", "fontWeight": "700", "color": "#1F2937"}),
+                html.H3(f"{kpis['total']:,}", style={"margin": "0", "fontSize": "28px", "fontWeight": "700", "color": "#1F2937"}),
                 html.P("Total Transactions", style={"margin": "4px 0 0 0", "fontSize": "14px", "color": "#6B7280", "fontWeight": "500"})
             ], style={"textAlign": "center"})
         ], style={"backgroundColor": "#FFFFFF", "borderRadius": "12px", "boxShadow": "0 1px 3px 0 rgba(0, 0, 0, 0.1)", "padding": "24px", "borderLeft": "4px solid #3B82F6"}),
         html.Div([
             html.Div([
-                html.H3(f"{metrics['success_rate']:.1f}%", style={"margin": "0", "fontSize": "28px", "fontWeight": "700", "color": "#10B981"}),
+                html.H3(f"{kpis['success_rate']:.1f}%", style={"margin": "0", "fontSize": "28px", "fontWeight": "700", "color": "#10B981"}),
                 html.P("Success Rate", style={"margin": "4px 0 0 0", "fontSize": "14px", "color": "#6B7280", "fontWeight": "500"})
             ], style={"textAlign": "center"})
         ], style={"backgroundColor": "#FFFFFF", "borderRadius": "12px", "boxShadow": "0 1px 3px 0 rgba(0, 0, 0, 0.1)", "padding": "24px", "borderLeft": "4px solid #10B981"}),
         html.Div([
             html.Div([
-                html.H3(f"€{metrics['total_amount']:,.2f}", style={"margin": "0", "fontSize": "28px", "fontWeight": "700", "color": "#1F2937"}),
+                html.H3(f"€{kpis['total_amount']:,.2f}", style={"margin": "0", "fontSize": "28px", "fontWeight": "700", "color": "#1F2937"}),
                 html.P("Total Amount", style={"margin": "4px 0 0 0", "fontSize": "14px", "color": "#6B7280", "fontWeight": "500"})
             ], style={"textAlign": "center"})
         ], style={"backgroundColor": "#FFFFFF", "borderRadius": "12px", "boxShadow": "0 1px 3px 0 rgba(0, 0, 0, 0.1)", "padding": "24px", "borderLeft": "4px solid #F59E0B"}),
         html.Div([
             html.Div([
-                html.H3(f"€{metrics['avg_amount']:,.2f}", style={"margin": "0", "fontSize": "28px", "fontWeight": "700", "color": "#1F2937"}),
+                html.H3(f"€{kpis['avg_amount']:,.2f}", style={"margin": "0", "fontSize": "28px", "fontWeight": "700", "color": "#1F2937"}),
                 html.P("Average Amount", style={"margin": "4px 0 0 0", "fontSize": "14px", "color": "#6B7280", "fontWeight": "500"})
             ], style={"textAlign": "center"})
         ], style={"backgroundColor": "#FFFFFF", "borderRadius": "12px", "boxShadow": "0 1px 3px 0 rgba(0, 0, 0, 0.1)", "padding": "24px", "borderLeft": "4px solid #8B5CF6"})
     ]
+    by_iface, amount, status_dist, timeline = figure_patches(view["figures"])
     return (
-        transactions_by_iface(df),
-        amount_by_iface(df),
-        status_distribution(df),
-        df.to_dict("records"),
-        metrics_cards
+        by_iface,
+        amount,
+        status_dist,
+        timeline,
+        rows,
+        metrics_cards,
+        seen
     )
 
 # ---------- Startup ----------
-if not check_connectivity():
-    print("⚠️ Warning: API not reachable at startup.")
+# Point d'entrée WSGI (gunicorn app_dash:server) ; les threads d'arrière-plan sont démarrés
+# dans chaque worker après le fork (gunicorn.conf.py), jamais à l'import
+server = app.server
+
+@server.route("/healthz")
+def healthz():
+    return {"status": "ok", "api_reachable": api_status["reachable"], "api_checked_at": api_status["checked_at"]}
+
+_background_pid = None
+
+def start_background():
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    _background_pid = os.getpid()
+    live_feed.start()
+    for target, name in ((refresh_loop, "dashboard-refresh"), (health_probe, "api-health-probe")):
+        threading.Thread(target=target, name=name, daemon=True).start()
+
+metrics.STARTUP_SECONDS.set(time.perf_counter() - STARTED)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8501, debug=True)
\ No newline at end of file
+    # Serveur de développement ; en production : gunicorn -c gunicorn.conf.py app_dash:server
+    start_background()
+    app.run(host="0.0.0.0", port=8501, debug=os.getenv("DASH_DEBUG", "1") == "1")
\ No newline at end of file
@@ -0,0 +1,22 @@
+import os
+import diskcache
+
+# Cache disque local partagé par tous les workers gunicorn du conteneur
+CACHE_DIR = os.getenv("DASHBOARD_CACHE_DIR", "/tmp/dashboard-cache")
+CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "300"))
+LOCK_TIMEOUT = 30
+
+cache = diskcache.Cache(CACHE_DIR)
+
+def get_or_compute(key, compute, ttl=CACHE_TTL):
+    value = cache.get(key)
+    if value is not None:
+        return value
+    # Un seul processus calcule la valeur ; les autres attendent le verrou puis la relisent
+    with diskcache.Lock(cache, f"lock:{key!r}", expire=LOCK_TIMEOUT):
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                cache.set(key, value, expire=ttl)
+    return value
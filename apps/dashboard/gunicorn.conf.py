@@ -0,0 +1,34 @@
+# Serveur de production du dashboard : gunicorn -c gunicorn.conf.py app_dash:server
+import os, shutil, time
+
+bind = os.getenv("DASHBOARD_BIND", "0.0.0.0:8501")
+workers = int(os.getenv("DASHBOARD_WORKERS", "4"))
+# Callbacks surtout en attente réseau (API) : quelques threads par worker
+worker_class = "gthread"
+threads = int(os.getenv("DASHBOARD_THREADS", "4"))
+timeout = 60
+# L'app est importée une seule fois dans le master puis partagée par fork (copy-on-write)
+preload_app = True
+
+_started = time.perf_counter()
+
+# Métriques multiprocess : répertoire vidé avant le préchargement de l'app par le master
+_metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if _metrics_dir:
+    shutil.rmtree(_metrics_dir, ignore_errors=True)
+    os.makedirs(_metrics_dir, exist_ok=True)
+
+def when_ready(server):
+    server.log.info("dashboard ready in %.2fs (%d workers x %d threads)",
+                    time.perf_counter() - _started, workers, threads)
+
+def post_fork(server, worker):
+    import app_dash, data_cache
+    # Pas de connexion SQLite héritée du master ; les threads ne survivent pas au fork
+    data_cache.cache.close()
+    app_dash.start_background()
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
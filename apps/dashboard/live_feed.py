@@ -0,0 +1,57 @@
+import json, threading, time
+from collections import deque
+import requests
+
+
+# Un seul flux SSE par processus Dash, partagé par toutes les sessions du navigateur
+class LiveFeed:
+    def __init__(self, url, seed, maxlen=100):
+        self.url = url
+        self.seed = seed
+        self.rows = deque(maxlen=maxlen)
+        self.version = 0
+        # Epoch de l'ETL reçu avec chaque lot ; None tant qu'aucun lot n'est arrivé
+        self.epoch = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+            self._thread.start()
+
+    def snapshot(self):
+        with self._lock:
+            return self.version, list(self.rows)
+
+    def _reset(self, rows):
+        with self._lock:
+            self.rows.clear()
+            self.rows.extend(rows)
+            self.version += 1
+
+    def _apply(self, event):
+        # Les lignes arrivent de la plus récente à la plus ancienne
+        with self._lock:
+            for row in reversed(event["rows"]):
+                self.rows.appendleft(row)
+            self.epoch = event.get("epoch", self.epoch)
+            self.version += 1
+
+    def _run(self):
+        while True:
+            try:
+                with requests.get(self.url, stream=True, timeout=(5, 60)) as resp:
+                    resp.raise_for_status()
+                    # (Re)connecté : on repart d'un instantané pour ne rien manquer
+                    self._reset(self.seed(self.rows.maxlen))
+                    data = []
+                    for line in resp.iter_lines(decode_unicode=True):
+                        if line.startswith("data:"):
+                            data.append(line[5:].strip())
+                        elif not line and data:
+                            self._apply(json.loads("\n".join(data)))
+                            data = []
+            except requests.exceptions.RequestException as e:
+                print(f"Live feed disconnected: {e}")
+                time.sleep(5)
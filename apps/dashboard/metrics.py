@@ -0,0 +1,45 @@
+import functools, os, time
+from flask import Response
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+CALLBACK_DURATION = Histogram(
+    "dashboard_callback_duration_seconds", "Dash callback duration", ["callback"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+# Sous gunicorn (PROMETHEUS_MULTIPROC_DIR), les jauges sont agrégées sur tous les workers
+CALLBACKS_IN_PROGRESS = Gauge(
+    "dashboard_callbacks_in_progress", "Dash callbacks currently running", ["callback"],
+    multiprocess_mode="livesum",
+)
+STARTUP_SECONDS = Gauge("dashboard_startup_seconds", "Time to import the Dash app", multiprocess_mode="max")
+API_REACHABLE = Gauge("dashboard_api_reachable", "Last API health probe result", multiprocess_mode="livemax")
+
+def timed(name):
+    # À placer sous @app.callback : mesure aussi les appels interrompus par PreventUpdate
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            in_progress = CALLBACKS_IN_PROGRESS.labels(name)
+            in_progress.inc()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                in_progress.dec()
+                CALLBACK_DURATION.labels(name).observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def render():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+def register(server):
+    # /metrics sur le serveur Flask sous-jacent de Dash
+    server.add_url_rule(
+        "/metrics", "metrics", lambda: Response(render(), mimetype=CONTENT_TYPE_LATEST)
+    )
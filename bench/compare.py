@@ -0,0 +1,49 @@
+"""Compare two benchmark result files: python bench/compare.py BASELINE.json CANDIDATE.json"""
+import argparse, json
+
+# Metrics where a higher value is better; every other metric is a latency or duration
+HIGHER_IS_BETTER = ("rows_per_s", "rps", "callbacks_per_s", "inserted", "requests", "samples")
+IGNORED = ("args", "started_at", "git", "python", "host")
+
+
+def flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for k, v in value.items():
+            if not prefix and k in IGNORED:
+                continue
+            yield from flatten(v, f"{prefix}.{k}" if prefix else k)
+    elif isinstance(value, list):
+        for item in value:
+            # List entries (e.g. ETL sizes) are keyed by their row count
+            key = item.get("rows", len(value)) if isinstance(item, dict) else len(value)
+            yield from flatten({k: v for k, v in item.items() if k != "rows"}, f"{prefix}[{key}]")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=5.0, help="percent change to flag")
+    args = parser.parse_args()
+    with open(args.baseline) as f:
+        base = dict(flatten(json.load(f)))
+    with open(args.candidate) as f:
+        cand = dict(flatten(json.load(f)))
+
+    regressions = 0
+    for key in sorted(base.keys() & cand.keys()):
+        old, new = base[key], cand[key]
+        change = (new - old) / old * 100 if old else 0.0
+        better = change > 0 if key.rsplit(".", 1)[-1] in HIGHER_IS_BETTER else change < 0
+        flag = ""
+        if abs(change) >= args.threshold:
+            flag = "improved" if better else "REGRESSED"
+            regressions += not better
+        print(f"{key:60} {old:12.2f} -> {new:12.2f} {change:+7.1f}% {flag}")
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
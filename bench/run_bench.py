@@ -0,0 +1,256 @@
+"""End-to-end pipeline benchmarks against the local docker-compose stack.
+
+Start the stack with `docker compose -f deploy/docker-compose.yml up -d`, then stop the
+etl_job container (`docker compose stop etl_job`) before the ETL scenario so it is the
+only consumer. Results are written to bench/results/<timestamp>.json and can be
+compared with bench/compare.py.
+"""
+import argparse, json, os, platform, random, subprocess, sys, threading, time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "etl"), os.path.join(ROOT, "apps", "dashboard")]
+
+SRC_DSN = os.getenv("BENCH_SRC_DSN", "dbname=sourcedb user=source password=source host=localhost port=5433")
+APP_DSN = os.getenv("BENCH_APP_DSN", "dbname=appdb user=app password=app host=localhost port=5434")
+# etl_job opens its own connections too (partition creation): point them at the same databases
+os.environ["ETL_SRC_DSN"] = SRC_DSN
+os.environ["ETL_APP_DSN"] = APP_DSN
+API_URL = os.getenv("BENCH_API_URL", "http://localhost:8000/api")
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    pick = lambda p: values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+    return {"p50": pick(50) * 1000, "p95": pick(95) * 1000, "p99": pick(99) * 1000}
+
+
+def seed_source(conn, n, rng):
+    from psycopg2.extras import execute_values
+    from generator import random_tx
+    with conn.cursor() as cur:
+        for i in range(0, n, 10000):
+            rows = [random_tx(rng) for _ in range(min(10000, n - i))]
+            execute_values(cur, "INSERT INTO transactions (iface, ts, status, amount) VALUES %s", rows, page_size=10000)
+    conn.commit()
+
+
+def bench_etl(sizes, seed):
+    # Rows/sec of one incremental ETL cycle loading `size` new source rows
+    import psycopg2
+    import etl_job
+    rng = random.Random(seed)
+    results = []
+    for size in sizes:
+        src, dst = psycopg2.connect(SRC_DSN), psycopg2.connect(APP_DSN)
+        try:
+            etl_job.load_new(src, dst)  # drain anything pending first
+            seed_source(src, size, rng)
+            started = time.perf_counter()
+            inserted, _ = etl_job.load_new(src, dst)
+            elapsed = time.perf_counter() - started
+        finally:
+            src.close(); dst.close()
+        results.append({"rows": size, "inserted": inserted, "seconds": elapsed, "rows_per_s": inserted / elapsed})
+        print(f"etl: {size} rows in {elapsed:.2f}s ({inserted / elapsed:.0f} rows/s)")
+    return results
+
+
+def bench_api(paths, concurrency, requests_per_worker, bust_cache):
+    # Latency percentiles under `concurrency` parallel clients, one pooled session each
+    import requests
+    results = {}
+    for path in paths:
+        latencies, errors, lock = [], [0], threading.Lock()
+
+        def client(worker):
+            session = requests.Session()
+            local = []
+            for i in range(requests_per_worker):
+                url = f"{API_URL}{path}"
+                if bust_cache:
+                    url += ("&" if "?" in url else "?") + f"_bench={worker}-{i}-{time.time_ns()}"
+                t0 = time.perf_counter()
+                try:
+                    session.get(url, timeout=30).raise_for_status()
+                    local.append(time.perf_counter() - t0)
+                except requests.exceptions.RequestException:
+                    with lock:
+                        errors[0] += 1
+            with lock:
+                latencies.extend(local)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(w,)) for w in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        results[path] = {
+            "concurrency": concurrency, "requests": len(latencies), "errors": errors[0],
+            "rps": len(latencies) / elapsed, "latency_ms": percentiles(latencies),
+        }
+        lat = results[path]["latency_ms"]
+        print(f"api {path}: {results[path]['rps']:.0f} req/s p50={lat['p50']:.1f}ms "
+              f"p95={lat['p95']:.1f}ms p99={lat['p99']:.1f}ms ({errors[0]} errors)")
+    return results
+
+
+def bench_lag(samples, timeout):
+    # Source insert -> row visible in fact_transactions (needs the etl_job container running)
+    import psycopg2
+    src, dst = psycopg2.connect(SRC_DSN), psycopg2.connect(APP_DSN)
+    src.autocommit = dst.autocommit = True
+    lags, missed = [], 0
+    try:
+        for _ in range(samples):
+            with src.cursor() as cur:
+                cur.execute("INSERT INTO transactions (iface, ts, status, amount) "
+                            "VALUES ('POS', now(), 'ACCEPTED', 1.00) RETURNING id")
+                tx_id = cur.fetchone()[0]
+            started = time.perf_counter()
+            with dst.cursor() as cur:
+                while time.perf_counter() - started < timeout:
+                    cur.execute("SELECT 1 FROM fact_transactions WHERE id = %s", (tx_id,))
+                    if cur.fetchone():
+                        lags.append(time.perf_counter() - started)
+                        break
+                    time.sleep(0.005)
+                else:
+                    missed += 1
+            time.sleep(0.2)
+    finally:
+        src.close(); dst.close()
+    result = {"samples": len(lags), "missed": missed, "lag_ms": percentiles(lags)}
+    print(f"lag: p50={result['lag_ms']['p50']:.0f}ms p95={result['lag_ms']['p95']:.0f}ms ({missed} missed)")
+    return result
+
+
+def synthetic_dashboard_stats(data):
+    breakdown = {}
+    for row in data:
+        b = breakdown.setdefault((row["iface"], row["status"]), {"iface": row["iface"], "status": row["status"], "count": 0, "amount_sum": 0.0})
+        b["count"] += 1
+        b["amount_sum"] += row["amount"]
+    total = len(data)
+    accepted = sum(1 for row in data if row["status"] == "ACCEPTED")
+    amount_sum = sum(row["amount"] for row in data)
+    timeline = [{"bucket": row["ts"][:16], "status": row["status"], "count": 1} for row in data]
+    return {
+        "totals": {"total": total, "accepted": accepted, "rejected": total - accepted,
+                   "reject_rate": (total - accepted) / total * 100 if total else 0,
+                   "amount_sum": amount_sum, "amount_avg": amount_sum / total if total else 0},
+        "by_iface_status": list(breakdown.values()),
+        "timeline": timeline,
+    }
+
+
+def bench_dashboard_startup(runs):
+    # Cold import of app_dash in a fresh interpreter (what each restart pays without preload)
+    code = "import time; t = time.perf_counter(); import app_dash; print(time.perf_counter() - t)"
+    cwd = os.path.join(ROOT, "apps", "dashboard")
+    timings = []
+    for _ in range(runs):
+        out = subprocess.check_output([sys.executable, "-c", code], cwd=cwd, text=True)
+        timings.append(float(out.strip().splitlines()[-1]))
+    result = {"runs": runs, "import_ms": percentiles(timings)}
+    print(f"dashboard startup: import p50={result['import_ms']['p50']:.0f}ms p95={result['import_ms']['p95']:.0f}ms")
+    return result
+
+
+def bench_dashboard(rows, iterations, seed, concurrency=1):
+    # update_dashboard render time on synthetic rows and aggregates, without the network
+    import app_dash
+    from generator import random_tx
+    rng = random.Random(seed)
+    data = []
+    for i in range(rows):
+        iface, ts, status, amount = random_tx(rng)
+        data.append({"id": i, "iface": iface, "ts": ts.isoformat(), "status": status, "amount": amount})
+    stats = synthetic_dashboard_stats(data)
+    app_dash.get_dashboard_stats = lambda token=None: stats
+    app_dash.token_is_valid = lambda token: True
+    # Fresh epoch per call: measures a cache miss (fetch + figure build), not a cache read
+    app_dash.current_epoch = lambda: f"bench:{time.time_ns()}:{threading.get_ident()}"
+    app_dash.live_feed._reset(data)
+    timings, lock = [], threading.Lock()
+
+    def client():
+        local = []
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            app_dash.update_dashboard(1, "bench", None)
+            local.append(time.perf_counter() - t0)
+        with lock:
+            timings.extend(local)
+
+    # Concurrent sessions in one process: shows how much callbacks serialize on the GIL
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    result = {"rows": rows, "iterations": iterations, "concurrency": concurrency,
+              "callbacks_per_s": len(timings) / elapsed, "render_ms": percentiles(timings)}
+    print(f"dashboard: update_dashboard p50={result['render_ms']['p50']:.1f}ms p95={result['render_ms']['p95']:.1f}ms "
+          f"({result['callbacks_per_s']:.0f}/s with {concurrency} concurrent sessions)")
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monitoring pipeline benchmarks")
+    parser.add_argument("--only", default="etl,api,lag,dashboard,dashboard_startup", help="comma-separated scenarios")
+    parser.add_argument("--etl-sizes", default="10000,100000,1000000")
+    parser.add_argument("--api-paths", default="/transactions?limit=100,/stats/summary")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per client")
+    parser.add_argument("--bust-cache", action="store_true", help="unique query string per request")
+    parser.add_argument("--lag-samples", type=int, default=50)
+    parser.add_argument("--lag-timeout", type=float, default=30)
+    parser.add_argument("--dashboard-rows", type=int, default=100)
+    parser.add_argument("--dashboard-iterations", type=int, default=50)
+    parser.add_argument("--dashboard-concurrency", type=int, default=1)
+    parser.add_argument("--startup-runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="results file (default bench/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    scenarios = set(args.only.split(","))
+    results = {
+        "started_at": datetime.now().isoformat(), "git": git_revision(),
+        "python": platform.python_version(), "host": platform.node(), "args": vars(args),
+    }
+    if "etl" in scenarios:
+        results["etl"] = bench_etl([int(s) for s in args.etl_sizes.split(",")], args.seed)
+    if "api" in scenarios:
+        results["api"] = bench_api(args.api_paths.split(","), args.concurrency, args.requests, args.bust_cache)
+    if "lag" in scenarios:
+        results["lag"] = bench_lag(args.lag_samples, args.lag_timeout)
+    if "dashboard" in scenarios:
+        results["dashboard"] = bench_dashboard(args.dashboard_rows, args.dashboard_iterations, args.seed,
+                                               args.dashboard_concurrency)
+    if "dashboard_startup" in scenarios:
+        results["dashboard_startup"] = bench_dashboard_startup(args.startup_runs)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
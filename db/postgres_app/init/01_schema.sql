@@ -1,12 +1,18 @@
 
+-- Partitionnée par plage sur ts : l'ETL crée les partitions (jour ou mois), retention.py les purge.
+-- Pas de partition DEFAULT : une ligne sans partition attachée fait échouer le chargement
 CREATE TABLE fact_transactions (
-    id SERIAL PRIMARY KEY,
+    id BIGINT NOT NULL, -- (namespace de la source << 40) | id dans la source
     iface VARCHAR(10),
-    ts TIMESTAMP,
+    ts TIMESTAMP NOT NULL,
     status VARCHAR(16),
     amount NUMERIC(12,2),
-    etl_loaded_at TIMESTAMP DEFAULT now()
-);
+    etl_loaded_at TIMESTAMP DEFAULT now(),
+    PRIMARY KEY (id, ts)
+) PARTITION BY RANGE (ts);
+
+CREATE INDEX ix_fact_transactions_ts_brin ON fact_transactions USING brin (ts);
+CREATE INDEX ix_fact_transactions_iface_status_ts ON fact_transactions (iface, status, ts);
 
 -- Users table for authentication
 CREATE TABLE users (
@@ -19,3 +25,84 @@ CREATE TABLE users (
 -- Insert initial admin user (password: admin, hashed with bcrypt)
 INSERT INTO users (username, hashed_password, role)
 VALUES ('admin', '$2b$12$Krt6S5GQ2RNxL1GcS61j1uG3tWb4vPS3MevG3657cVmGAP6JZoXJC', 'admin');
+
+-- ETL high-water mark: last source row loaded into fact_transactions
+CREATE TABLE etl_watermark (
+    source VARCHAR(64) PRIMARY KEY,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    last_ts TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT now()
+);
+
+-- Backfill: plages d'ids chargées en parallèle (reprise des plages non terminées)
+CREATE TABLE etl_backfill_ranges (
+    source VARCHAR(64) NOT NULL,
+    lo BIGINT NOT NULL,
+    hi BIGINT NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'pending', -- pending / done / failed
+    rows_loaded BIGINT DEFAULT 0,
+    error TEXT,
+    updated_at TIMESTAMP DEFAULT now(),
+    PRIMARY KEY (source, lo, hi)
+);
+
+-- Rollups maintenus par l'ETL (par minute et par heure) pour les endpoints /stats
+CREATE TABLE agg_transactions_minute (
+    bucket TIMESTAMP NOT NULL,
+    iface VARCHAR(10) NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    tx_count BIGINT NOT NULL DEFAULT 0,
+    amount_sum NUMERIC(18,2) NOT NULL DEFAULT 0,
+    amount_min NUMERIC(12,2),
+    amount_max NUMERIC(12,2),
+    PRIMARY KEY (bucket, iface, status)
+);
+
+CREATE TABLE agg_transactions_hour (LIKE agg_transactions_minute INCLUDING ALL);
+
+-- Totaux depuis l'origine par (iface, status), lus en temps constant par /stats/summary et
+-- /stats/dashboard. Plusieurs lignes (shard) par clé : chaque connexion de l'ETL écrit dans
+-- la sienne, les sources et les workers de backfill ne se bloquent pas jusqu'au commit
+CREATE TABLE agg_transactions_total (
+    shard SMALLINT NOT NULL,
+    iface VARCHAR(10) NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    tx_count BIGINT NOT NULL DEFAULT 0,
+    amount_sum NUMERIC(18,2) NOT NULL DEFAULT 0,
+    amount_min NUMERIC(12,2),
+    amount_max NUMERIC(12,2),
+    PRIMARY KEY (shard, iface, status)
+);
+
+-- Pagination par curseur (ts, id) sur /api/transactions, avec ou sans filtre
+CREATE INDEX ix_fact_transactions_ts_id ON fact_transactions (ts DESC, id DESC);
+CREATE INDEX ix_fact_transactions_iface_ts_id ON fact_transactions (iface, ts DESC, id DESC);
+CREATE INDEX ix_fact_transactions_status_ts_id ON fact_transactions (status, ts DESC, id DESC);
+
+-- Epoch incrémenté par l'ETL à chaque commit : invalide les caches de l'API
+CREATE SEQUENCE etl_epoch;
+
+
+-- Alertes de pic de rejet émises par la détection en flux de l'ETL
+CREATE TABLE anomaly_alerts (
+    id BIGSERIAL PRIMARY KEY,
+    detected_at TIMESTAMP NOT NULL DEFAULT now(),
+    window_end TIMESTAMP NOT NULL,
+    iface VARCHAR(10) NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    rate DOUBLE PRECISION NOT NULL,
+    baseline DOUBLE PRECISION NOT NULL,
+    zscore DOUBLE PRECISION NOT NULL,
+    tx_count INTEGER NOT NULL,
+    window_total INTEGER NOT NULL
+);
+CREATE INDEX ix_anomaly_alerts_iface_id ON anomaly_alerts (iface, id DESC);
+
+-- Sketch de quantiles des montants par heure et interface (indices logarithmiques, cf. etl_job.sketch_sql)
+CREATE TABLE agg_amount_sketch_hour (
+    bucket TIMESTAMP NOT NULL,
+    iface VARCHAR(10) NOT NULL,
+    idx INTEGER NOT NULL,
+    tx_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, iface, idx)
+);
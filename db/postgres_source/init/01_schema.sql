@@ -5,3 +5,16 @@ CREATE TABLE transactions (
     status VARCHAR(16), -- ACCEPTED / REJECT_TECH / REJECT_FUNC
     amount NUMERIC(12,2)
 );
+
+-- CDC : notifie l'ETL (LISTEN transactions_new) avec le plus grand id inséré
+CREATE FUNCTION notify_transactions() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('transactions_new', (SELECT max(id) FROM new_rows)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER transactions_notify
+AFTER INSERT ON transactions
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_transactions();
@@ -0,0 +1,163 @@
+import json, math, os
+from collections import deque
+from datetime import datetime, timedelta
+
+# Détection en flux des pics de rejet par interface, sans relire l'historique :
+# fenêtre glissante de WINDOW_SLOTS créneaux de SLOT_SECONDS, baseline EWMA par iface×status
+SLOT_SECONDS = int(os.getenv("ANOMALY_SLOT_SECONDS", "10"))
+WINDOW_SLOTS = int(os.getenv("ANOMALY_WINDOW_SLOTS", "6"))
+EWMA_ALPHA = float(os.getenv("ANOMALY_EWMA_ALPHA", "0.05"))
+Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "4"))
+MIN_WINDOW_COUNT = int(os.getenv("ANOMALY_MIN_WINDOW_COUNT", "20"))
+WARMUP_SLOTS = int(os.getenv("ANOMALY_WARMUP_SLOTS", "30"))
+# Plancher de l'écart-type : une baseline parfaitement stable ne déclenche pas sur une seule ligne
+MIN_STDDEV = float(os.getenv("ANOMALY_MIN_STDDEV", "0.01"))
+# Test binomial en plus du z-score : au faible débit, le bruit d'échantillonnage d'une fenêtre
+# de quelques dizaines de lignes dépasse la variance de la baseline EWMA. Alerte seulement si
+# observer autant de rejets sous le taux de la baseline est plus improbable que P_VALUE
+P_VALUE = float(os.getenv("ANOMALY_P_VALUE", "1e-6"))
+# Taux minimal prêté à une baseline sans rejet, sans quoi un seul rejet serait improbable
+MIN_BASELINE_RATE = float(os.getenv("ANOMALY_MIN_BASELINE_RATE", "0.001"))
+WATCHED_STATUSES = ("REJECT_TECH", "REJECT_FUNC")
+
+ALERTS_CHANNEL = "anomaly_alerts"
+# Les ts de la source sont naïfs : créneaux comptés depuis une origine naïve elle aussi
+SLOT_ORIGIN = datetime(2000, 1, 1)
+
+class Baseline:
+    # Moyenne et variance exponentielles du taux observé à chaque fin de créneau
+    def __init__(self):
+        self.mean = 0.0
+        self.var = 0.0
+        self.samples = 0
+
+    def zscore(self, value, n):
+        # Écart-type au moins égal à celui d'une proportion binomiale sur n lignes
+        p = min(max(self.mean, 0.0), 1.0)
+        return (value - self.mean) / max(math.sqrt(self.var), math.sqrt(p * (1 - p) / n), MIN_STDDEV)
+
+    def update(self, value):
+        if self.samples == 0:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            incr = EWMA_ALPHA * diff
+            self.mean += incr
+            self.var = (1 - EWMA_ALPHA) * (self.var + diff * incr)
+        self.samples += 1
+
+def binomial_sf(k, n, p):
+    # P(X >= k) pour X ~ B(n, p) ; seule la queue au-delà de la moyenne sert au test
+    if k <= n * p:
+        return 1.0
+    if p <= 0:
+        return 0.0
+    term = math.exp(
+        math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)
+        + k * math.log(p) + (n - k) * math.log1p(-p)
+    )
+    total = 0.0
+    # Termes décroissants au-delà de la moyenne : arrêt dès qu'ils deviennent négligeables
+    for i in range(k, n + 1):
+        total += term
+        if term <= total * 1e-12:
+            break
+        term *= (n - i) / (i + 1) * p / (1 - p)
+    return min(total, 1.0)
+
+class IfaceWindow:
+    # Compteurs par créneau + sommes courantes : ajout et glissement en O(1)
+    def __init__(self):
+        self.slots = deque([{}])
+        self.totals = {}
+        self.count = 0
+
+    def add(self, status):
+        slot = self.slots[-1]
+        slot[status] = slot.get(status, 0) + 1
+        self.totals[status] = self.totals.get(status, 0) + 1
+        self.count += 1
+
+    def slide(self):
+        self.slots.append({})
+        if len(self.slots) > WINDOW_SLOTS:
+            for status, n in self.slots.popleft().items():
+                self.totals[status] -= n
+                self.count -= n
+
+class Detector:
+    def __init__(self):
+        self.slot = None
+        self.windows = {}
+        self.baselines = {}
+        self.active = set()
+
+    def feed(self, rows):
+        # rows : (id, iface, ts, status, amount) ; renvoie les alertes des créneaux clos
+        alerts = []
+        for _, iface, ts, status, _ in rows:
+            if ts is None or iface is None:
+                continue
+            slot = int((ts - SLOT_ORIGIN).total_seconds() // SLOT_SECONDS)
+            if self.slot is None:
+                self.slot = slot
+            if slot > self.slot:
+                alerts.extend(self.advance(slot))
+            elif slot <= self.slot - WINDOW_SLOTS:
+                continue  # trop ancien pour la fenêtre courante
+            self.windows.setdefault(iface, IfaceWindow()).add(status or "")
+        return alerts
+
+    def advance(self, slot):
+        # Ferme les créneaux jusqu'à `slot` ; après un long silence la fenêtre repart à vide
+        alerts = []
+        steps = slot - self.slot
+        for _ in range(min(steps, WINDOW_SLOTS)):
+            alerts.extend(self.evaluate())
+            for window in self.windows.values():
+                window.slide()
+            self.slot += 1
+        self.slot = slot
+        return alerts
+
+    def evaluate(self):
+        alerts = []
+        window_end = SLOT_ORIGIN + timedelta(seconds=(self.slot + 1) * SLOT_SECONDS)
+        for iface, window in self.windows.items():
+            if window.count < MIN_WINDOW_COUNT:
+                continue
+            for status in WATCHED_STATUSES:
+                n = window.totals.get(status, 0)
+                rate = n / window.count
+                baseline = self.baselines.setdefault((iface, status), Baseline())
+                z = baseline.zscore(rate, window.count)
+                key = (iface, status)
+                if (baseline.samples >= WARMUP_SLOTS and z >= Z_THRESHOLD
+                        and binomial_sf(n, window.count, max(baseline.mean, MIN_BASELINE_RATE)) < P_VALUE):
+                    # Une seule alerte par épisode : réarmée quand le z-score redescend
+                    if key not in self.active:
+                        self.active.add(key)
+                        alerts.append({
+                            "window_end": window_end, "iface": iface, "status": status,
+                            "rate": rate, "baseline": baseline.mean, "zscore": z,
+                            "tx_count": n, "window_total": window.count,
+                        })
+                    # Pendant l'épisode, le pic n'est pas absorbé par la baseline
+                    continue
+                if z < Z_THRESHOLD / 2:
+                    self.active.discard(key)
+                baseline.update(rate)
+        return alerts
+
+def save_alerts(dst_cur, alerts):
+    # Transaction courte juste après le commit du chargement : visibles et notifiées à son commit
+    for alert in alerts:
+        dst_cur.execute("""
+            INSERT INTO anomaly_alerts
+                (window_end, iface, status, rate, baseline, zscore, tx_count, window_total)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        """, (alert["window_end"], alert["iface"], alert["status"], alert["rate"],
+              alert["baseline"], alert["zscore"], alert["tx_count"], alert["window_total"]))
+        alert["id"] = dst_cur.fetchone()[0]
+        dst_cur.execute("SELECT pg_notify(%s, %s)", (ALERTS_CHANNEL, json.dumps(alert, default=str)))
@@ -0,0 +1,103 @@
+import argparse, os
+from datetime import datetime
+import psycopg2
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from etl_job import APP_DSN, BATCH_SIZE, ITERSIZE, batches, wait_for_db
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "/archive")
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+
+SCHEMA = pa.schema([
+    ("id", pa.int64()), ("iface", pa.string()), ("ts", pa.timestamp("us")),
+    ("status", pa.string()), ("amount", pa.float64()), ("etl_loaded_at", pa.timestamp("us")),
+])
+
+def period_dir(start):
+    # Un répertoire par période (partitionnement hive : period=YYYY-MM-DD). Chaque archivage y
+    # ajoute son propre fichier : une partition recréée puis réarchivée n'écrase pas le premier
+    return os.path.join(ARCHIVE_DIR, f"period={start:%Y-%m-%d}")
+
+def to_record_batch(rows):
+    columns = list(zip(*rows))
+    columns[4] = [float(a) if a is not None else None for a in columns[4]]
+    return pa.record_batch([pa.array(c, type=f.type) for c, f in zip(columns, SCHEMA)], schema=SCHEMA)
+
+def published_path(tmp):
+    # .part-<horodatage>-<oid>.parquet.tmp -> part-<horodatage>-<oid>.parquet
+    return os.path.join(os.path.dirname(tmp), os.path.basename(tmp)[1:-len(".tmp")])
+
+def archive_partition(conn, name, start):
+    # Trié par (iface, ts) : les statistiques des row groups permettent d'élaguer à la lecture.
+    # Écrit sous un nom en attente (préfixe "." : ignoré par les lecteurs du dataset) portant
+    # l'oid de la table, publié seulement après la suppression de la partition
+    cur = conn.cursor()
+    cur.execute("SELECT %s::regclass::oid", (name,))
+    oid = cur.fetchone()[0]
+    os.makedirs(period_dir(start), exist_ok=True)
+    tmp = os.path.join(period_dir(start), f".part-{datetime.utcnow():%Y%m%dT%H%M%S%f}-{oid}.parquet.tmp")
+    cur = conn.cursor(name="archive_extract")
+    cur.itersize = ITERSIZE
+    cur.execute(f"SELECT id, iface, ts, status, amount, etl_loaded_at FROM {name} ORDER BY iface, ts")
+    archived = 0
+    with pq.ParquetWriter(tmp, SCHEMA, compression=ARCHIVE_COMPRESSION) as writer:
+        for rows in batches(cur, BATCH_SIZE):
+            writer.write_batch(to_record_batch(rows))
+            archived += len(rows)
+    cur.close()
+    return tmp, archived
+
+def archive_and_drop(conn, name, start):
+    # Les lignes ne sont jamais à la fois dans la base et dans l'archive publiée : le DROP est
+    # validé d'abord, puis le fichier est publié par renommage atomique
+    tmp, archived = archive_partition(conn, name, start)
+    try:
+        cur = conn.cursor()
+        cur.execute(f"ALTER TABLE fact_transactions DETACH PARTITION {name}")
+        cur.execute(f"DROP TABLE {name}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        os.remove(tmp)
+        raise
+    path = published_path(tmp)
+    os.replace(tmp, path)
+    return path, archived
+
+def publish_pending(cur):
+    # Fichiers en attente laissés par un arrêt brutal : si la table de l'oid existe encore, le
+    # DROP n'a pas été validé et le fichier est supprimé ; sinon il est publié
+    if not os.path.isdir(ARCHIVE_DIR):
+        return
+    for period in os.listdir(ARCHIVE_DIR):
+        if not period.startswith("period="):
+            continue
+        for filename in os.listdir(os.path.join(ARCHIVE_DIR, period)):
+            if not (filename.startswith(".part-") and filename.endswith(".parquet.tmp")):
+                continue
+            tmp = os.path.join(ARCHIVE_DIR, period, filename)
+            oid = int(filename[:-len(".parquet.tmp")].rsplit("-", 1)[1])
+            cur.execute("SELECT 1 FROM pg_class WHERE oid = %s", (oid,))
+            if cur.fetchone() is not None:
+                os.remove(tmp)
+                print(f"stale pending archive {tmp} removed")
+            else:
+                os.replace(tmp, published_path(tmp))
+                print(f"pending archive {published_path(tmp)} published")
+
+if __name__ == "__main__":
+    from retention import list_partitions
+    parser = argparse.ArgumentParser(description="Archive one fact_transactions partition to Parquet and drop it")
+    parser.add_argument("partition", help="e.g. fact_transactions_p20240101")
+    args = parser.parse_args()
+    wait_for_db(APP_DSN, "App DB")
+    conn = psycopg2.connect(APP_DSN)
+    try:
+        starts = dict(list_partitions(conn.cursor()))
+        if args.partition not in starts:
+            raise SystemExit(f"unknown partition {args.partition}")
+        path, archived = archive_and_drop(conn, args.partition, starts[args.partition])
+        print(f"{archived} rows archived to {path}")
+    finally:
+        conn.close()
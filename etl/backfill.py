@@ -0,0 +1,141 @@
+import argparse, os, time
+from multiprocessing import Pool
+import psycopg2
+
+from etl_job import (APP_DSN, SOURCES, BATCH_SIZE, wait_for_db, source_by_name,
+                     extract, transform, batches, copy_batch, MissingPartitions,
+                     create_partitions, expired_before, partition_bounds, period_start)
+
+WORKERS = int(os.getenv("BACKFILL_WORKERS", str(os.cpu_count() or 4)))
+RANGE_SIZE = int(os.getenv("BACKFILL_RANGE_SIZE", "100000"))
+
+def plan_ranges(source, from_id, to_id, range_size):
+    # Plages alignées sur range_size : une relance retrouve les mêmes clés
+    src = psycopg2.connect(source["dsn"])
+    cur = src.cursor()
+    cur.execute("SELECT COALESCE(min(id), 1), COALESCE(max(id), 0), min(ts), max(ts) FROM transactions")
+    min_id, max_id, min_ts, max_ts = cur.fetchone()
+    src.close()
+    # Partitions créées avant de lancer les workers, hors de leurs transactions de chargement ;
+    # rien pour les périodes déjà purgées par la rétention, dont les lignes sont écartées
+    if min_ts is not None:
+        starts, start = [], max(period_start(min_ts), expired_before())
+        while start <= max_ts:
+            starts.append(start)
+            start = partition_bounds(start)[1]
+        create_partitions(starts)
+    lo = ((from_id if from_id is not None else min_id - 1) // range_size) * range_size
+    hi = to_id if to_id is not None else max_id
+
+    dst = psycopg2.connect(APP_DSN)
+    cur = dst.cursor()
+    while lo < hi:
+        cur.execute("""
+            INSERT INTO etl_backfill_ranges(source, lo, hi) VALUES (%s, %s, %s)
+            ON CONFLICT DO NOTHING
+        """, (source["name"], lo, lo + range_size))
+        lo += range_size
+    dst.commit()
+    cur.execute("""
+        SELECT lo, hi FROM etl_backfill_ranges
+        WHERE source = %s AND status <> 'done' AND lo < %s ORDER BY lo
+    """, (source["name"], hi))
+    ranges = [(source["name"], lo, hi) for lo, hi in cur.fetchall()]
+    dst.close()
+    return ranges, hi
+
+def load_batches(src, dst_cur, source, lo, hi):
+    loaded, extracted = 0, extract(src, lo, hi)
+    try:
+        for batch in batches(transform(extracted, source["namespace"]), BATCH_SIZE):
+            loaded += copy_batch(dst_cur, [row for row, _ in batch], source["name"])
+    finally:
+        extracted.close()
+    return loaded
+
+def load_range(bounds):
+    # Chaque worker a ses propres connexions ; la plage est marquée 'done' dans la même transaction
+    name, lo, hi = bounds
+    source = source_by_name(name)
+    started = time.perf_counter()
+    src = psycopg2.connect(source["dsn"])
+    dst = psycopg2.connect(APP_DSN)
+    dst_cur = dst.cursor()
+    try:
+        try:
+            loaded = load_batches(src, dst_cur, source, lo, hi)
+        except MissingPartitions as e:
+            # Lignes arrivées depuis la planification : partitions créées à part, plage rejouée
+            dst.rollback()
+            src.rollback()
+            create_partitions(e.starts)
+            loaded = load_batches(src, dst_cur, source, lo, hi)
+        dst_cur.execute("""
+            UPDATE etl_backfill_ranges SET status = 'done', rows_loaded = %s, error = NULL, updated_at = now()
+            WHERE source = %s AND lo = %s AND hi = %s
+        """, (loaded, name, lo, hi))
+        dst.commit()
+        return lo, hi, loaded, time.perf_counter() - started, None
+    except Exception as e:
+        dst.rollback()
+        dst_cur.execute("""
+            UPDATE etl_backfill_ranges SET status = 'failed', error = %s, updated_at = now()
+            WHERE source = %s AND lo = %s AND hi = %s
+        """, (str(e), name, lo, hi))
+        dst.commit()
+        return lo, hi, 0, time.perf_counter() - started, str(e)
+    finally:
+        src.close(); dst.close()
+
+def advance_watermark(source, max_id):
+    # Si toutes les plages sont terminées, l'ETL incrémental reprend après le backfill
+    dst = psycopg2.connect(APP_DSN)
+    cur = dst.cursor()
+    cur.execute("""
+        SELECT count(*) FROM etl_backfill_ranges
+        WHERE source = %s AND status <> 'done' AND lo < %s
+    """, (source["name"], max_id))
+    if cur.fetchone()[0] == 0:
+        cur.execute("""
+            INSERT INTO etl_watermark(source, last_id, updated_at) VALUES (%s, %s, now())
+            ON CONFLICT (source) DO UPDATE
+            SET last_id = GREATEST(etl_watermark.last_id, EXCLUDED.last_id), updated_at = now()
+        """, (source["name"], max_id))
+    dst.commit()
+    dst.close()
+
+def backfill(source, workers=WORKERS, range_size=RANGE_SIZE, from_id=None, to_id=None):
+    wait_for_db(source["dsn"], f"Source DB {source['name']}")
+    wait_for_db(APP_DSN, "App DB")
+
+    ranges, max_id = plan_ranges(source, from_id, to_id, range_size)
+    print(f"backfill {source['name']}: {len(ranges)} ranges to load with {workers} workers")
+    started = time.perf_counter()
+    total, failed = 0, 0
+    with Pool(workers) as pool:
+        for done, (lo, hi, loaded, elapsed, error) in enumerate(pool.imap_unordered(load_range, ranges), 1):
+            if error:
+                failed += 1
+                print(f"[{done}/{len(ranges)}] range ({lo}, {hi}] failed: {error}")
+                continue
+            total += loaded
+            rate = total / (time.perf_counter() - started)
+            print(f"[{done}/{len(ranges)}] range ({lo}, {hi}] {loaded} rows in {elapsed:.1f}s"
+                  f" - {total} rows total, {rate:.0f} rows/s")
+
+    if failed:
+        print(f"backfill: {failed} ranges failed, rerun to retry them")
+    elif from_id is None:
+        advance_watermark(source, max_id)
+    return failed == 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel backfill of fact_transactions")
+    parser.add_argument("--source", default=SOURCES[0]["name"], choices=[s["name"] for s in SOURCES])
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--range-size", type=int, default=RANGE_SIZE)
+    parser.add_argument("--from-id", type=int)
+    parser.add_argument("--to-id", type=int)
+    args = parser.parse_args()
+    ok = backfill(source_by_name(args.source), args.workers, args.range_size, args.from_id, args.to_id)
+    raise SystemExit(0 if ok else 1)
@@ -1,9 +1,87 @@
-import psycopg2, time
-from psycopg2 import OperationalError
-from datetime import datetime
+import csv, io, itertools, json, math, os, psycopg2, select, threading, time, traceback
+from collections import deque
+from datetime import datetime, timedelta
+from psycopg2 import OperationalError, errors
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+import anomaly
 
-SRC_DSN = "dbname=sourcedb user=source password=source host=postgres_source port=5432"
-APP_DSN = "dbname=appdb user=app password=app host=postgres_app port=5432"
+SRC_DSN = os.getenv("ETL_SRC_DSN", "dbname=sourcedb user=source password=source host=postgres_source port=5432")
+APP_DSN = os.getenv("ETL_APP_DSN", "dbname=appdb user=app password=app host=postgres_app port=5432")
+SOURCE_NAME = "postgres_source"
+# Sources alimentant fact_transactions, chargées en parallèle (un thread par source) :
+# ETL_SOURCES='[{"name": "...", "dsn": "...", "namespace": 1}, ...]'
+# Espace d'ids par source : id chargé = (namespace << ID_NAMESPACE_BITS) | id source
+ID_NAMESPACE_BITS = 40
+ID_MASK = (1 << ID_NAMESPACE_BITS) - 1
+# Un id chargé reste un BIGINT positif : namespace < 2^(63 - ID_NAMESPACE_BITS)
+MAX_NAMESPACE = (1 << (63 - ID_NAMESPACE_BITS)) - 1
+
+def check_sources(sources):
+    # Refus au démarrage : deux sources sur le même namespace se perdraient dans ON CONFLICT,
+    # deux noms identiques partageraient un watermark
+    names, namespaces = set(), set()
+    for source in sources:
+        name, namespace = source.get("name"), source.get("namespace")
+        if not name or not source.get("dsn"):
+            raise ValueError(f"ETL source {source!r} needs a name and a dsn")
+        if not isinstance(namespace, int) or not 0 <= namespace <= MAX_NAMESPACE:
+            raise ValueError(f"ETL source {name}: namespace must be an integer in [0, {MAX_NAMESPACE}]")
+        if name in names:
+            raise ValueError(f"ETL source name {name} is used twice")
+        if namespace in namespaces:
+            raise ValueError(f"ETL source {name}: namespace {namespace} is used by another source")
+        names.add(name)
+        namespaces.add(namespace)
+    return sources
+
+SOURCES = check_sources(
+    json.loads(os.getenv("ETL_SOURCES", "null")) or [{"name": SOURCE_NAME, "dsn": SRC_DSN, "namespace": 0}]
+)
+BATCH_SIZE = int(os.getenv("ETL_BATCH_SIZE", "10000"))
+ITERSIZE = int(os.getenv("ETL_ITERSIZE", "5000"))
+PARTITION_UNIT = os.getenv("ETL_PARTITION_UNIT", "day")  # day / month
+PARTITIONS_AHEAD = int(os.getenv("ETL_PARTITIONS_AHEAD", "2"))  # périodes futures créées d'avance
+# Même valeur que retention.py : les périodes au-delà sont détachées ou supprimées
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "90"))
+
+# Mode CDC : LISTEN sur la source, micro-batch borné en latence et en taille
+ETL_MODE = os.getenv("ETL_MODE", "listen")  # listen / poll
+LISTEN_CHANNEL = "transactions_new"
+MAX_LATENCY = float(os.getenv("ETL_MAX_LATENCY", "0.2"))
+MAX_BATCH = int(os.getenv("ETL_MAX_BATCH", str(BATCH_SIZE)))
+POLL_INTERVAL = float(os.getenv("ETL_POLL_INTERVAL", "10"))
+RETRY_MIN_DELAY = float(os.getenv("ETL_RETRY_MIN_DELAY", "5"))
+RETRY_MAX_DELAY = float(os.getenv("ETL_RETRY_MAX_DELAY", "300"))
+# Les ids viennent d'une séquence mais les transactions source commitent dans le désordre :
+# à chaque cycle, les ETL_RESCAN_IDS ids sous le watermark sont revérifiés et les lignes
+# validées entre-temps (absentes de fact_transactions) sont chargées
+RESCAN_IDS = int(os.getenv("ETL_RESCAN_IDS", "10000"))
+# Au-delà, la notification ne liste plus les ids tardifs (limite de taille de pg_notify)
+LATE_NOTIFY_MAX = 200
+METRICS_PORT = int(os.getenv("ETL_METRICS_PORT", "9101"))
+
+CYCLE_DURATION = Histogram("etl_cycle_duration_seconds", "Duration of one ETL cycle", ["source"])
+ROWS_EXTRACTED = Counter("etl_rows_extracted_total", "Rows read from the source", ["source"])
+ROWS_LOADED = Counter("etl_rows_loaded_total", "Rows inserted into fact_transactions", ["source"])
+BATCH_ROWS = Histogram("etl_batch_rows", "Rows per COPY batch", ["source"],
+                       buckets=(1, 10, 100, 500, 1000, 5000, 10000, 50000, 100000))
+LAG_SECONDS = Gauge("etl_lag_seconds", "Age of the newest loaded source row", ["source"])
+LAG_ROWS = Gauge("etl_lag_rows", "Source rows not yet loaded", ["source"])
+SOURCE_ERRORS = Counter("etl_source_errors_total", "Failed load attempts, retried with backoff",
+                        ["source", "error"])
+ROWS_SKIPPED = Counter("etl_rows_skipped_total", "Rows not loaded because their period was purged",
+                       ["source", "reason"])
+ANOMALY_ALERTS = Counter("etl_anomaly_alerts_total", "Reject-rate alerts raised", ["iface", "status"])
+
+# Sketch de quantiles des montants (buckets logarithmiques à la DDSketch) : un montant x
+# compte dans l'indice ceil(log_gamma(x)), erreur relative bornée par SKETCH_ACCURACY.
+# Doit rester identique côté API : changer la valeur invalide les sketches déjà stockés
+SKETCH_ACCURACY = float(os.getenv("SKETCH_RELATIVE_ACCURACY", "0.01"))
+SKETCH_LN_GAMMA = math.log((1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY))
+SKETCH_ZERO_INDEX = -32768  # montants nuls ou négatifs
+
+# Canal côté app DB : l'API relaie les nouvelles lignes aux dashboards
+LOADED_CHANNEL = "fact_transactions_loaded"
 
 def wait_for_db(dsn, name):
     while True:
@@ -16,38 +94,449 @@ def wait_for_db(dsn, name):
             print(f"waiting for {name}...")
             time.sleep(5)
 
-def etl():
-    wait_for_db(SRC_DSN, "Source DB")
-    wait_for_db(APP_DSN, "App DB")
+def source_by_name(name):
+    for source in SOURCES:
+        if source["name"] == name:
+            return source
+    raise KeyError(f"unknown source {name}")
 
-    src = psycopg2.connect(SRC_DSN)
-    dst = psycopg2.connect(APP_DSN)
-    src_cur, dst_cur = src.cursor(), dst.cursor()
+def namespaced(source, id_):
+    return (source["namespace"] << ID_NAMESPACE_BITS) | id_
+
+def get_watermark(dst_cur, source):
+    # Verrouille la ligne pour que deux jobs ne chargent pas la même plage
+    dst_cur.execute(
+        "SELECT last_id FROM etl_watermark WHERE source = %s FOR UPDATE", (source,)
+    )
+    row = dst_cur.fetchone()
+    return row[0] if row else 0
+
+def set_watermark(dst_cur, source, last_id, last_ts):
+    dst_cur.execute("""
+        INSERT INTO etl_watermark(source, last_id, last_ts, updated_at)
+        VALUES (%s, %s, %s, now())
+        ON CONFLICT (source) DO UPDATE
+        SET last_id = EXCLUDED.last_id,
+            last_ts = COALESCE(EXCLUDED.last_ts, etl_watermark.last_ts),
+            updated_at = now()
+    """, (source, last_id, last_ts))
+
+def partition_bounds(start):
+    if PARTITION_UNIT == "month":
+        end = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        return f"fact_transactions_p{start:%Y%m}", end
+    return f"fact_transactions_p{start:%Y%m%d}", start + timedelta(days=1)
+
+class MissingPartitions(Exception):
+    def __init__(self, starts):
+        super().__init__(f"no attached partition for {', '.join(f'{s:%Y-%m-%d}' for s in starts)}")
+        self.starts = starts
+
+def period_start(ts):
+    start = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start.replace(day=1) if PARTITION_UNIT == "month" else start
+
+def attached_partitions(cur):
+    # Partitions réellement attachées (une table détachée par retention.py garde son nom)
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'fact_transactions'::regclass
+    """)
+    return {name for (name,) in cur.fetchall()}
+
+# Périodes dont la table existe mais est détachée (hors rétention normale) : jamais recréées,
+# leurs lignes sont écartées comme celles des périodes expirées
+_detached = set()
+
+def create_partitions(starts):
+    # Connexion dédiée en autocommit : CREATE ... PARTITION OF prend un verrou ACCESS EXCLUSIVE
+    # sur fact_transactions, jamais tenu dans une transaction de chargement
+    conn = psycopg2.connect(APP_DSN)
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        attached = attached_partitions(cur)
+        for start in sorted(set(starts)):
+            name, end = partition_bounds(start)
+            if name in attached:
+                continue
+            try:
+                cur.execute(
+                    f"CREATE TABLE {name} PARTITION OF fact_transactions FOR VALUES FROM (%s) TO (%s)",
+                    (start, end)
+                )
+                print(f"partition {name} created")
+            except (errors.DuplicateTable, errors.UniqueViolation):
+                # Créée en même temps par un autre worker, ou détachée par la rétention
+                if name not in attached_partitions(cur):
+                    print(f"partition {name} exists but is detached, its rows will be skipped")
+                    _detached.add(start)
+    finally:
+        conn.close()
+
+_ahead_from = None
+
+def ensure_partitions_ahead():
+    # Période courante + PARTITIONS_AHEAD suivantes, une fois par période et par processus
+    global _ahead_from
+    start = period_start(datetime.now())
+    if _ahead_from == start:
+        return
+    starts = [start]
+    for _ in range(PARTITIONS_AHEAD):
+        starts.append(partition_bounds(starts[-1])[1])
+    create_partitions(starts)
+    _ahead_from = start
+
+def expired_before():
+    # Début de la première période encore couverte par la rétention
+    return period_start(datetime.now() - timedelta(days=RETENTION_DAYS))
+
+def check_partitions(dst_cur, source_name=""):
+    # Aucune ligne ne doit finir hors partition : une période non attachée fait échouer le
+    # batch avant l'insertion, l'appelant annule, crée la partition à part et recommence.
+    # Les lignes d'une période déjà purgée sont écartées et comptées, sans bloquer la source
+    dst_cur.execute(
+        f"SELECT DISTINCT date_trunc('{PARTITION_UNIT}', ts) FROM stg_transactions WHERE ts IS NOT NULL"
+    )
+    starts = [start for (start,) in dst_cur.fetchall()]
+    cutoff = expired_before()
+    for reason, purged in (("expired", [s for s in starts if s < cutoff]),
+                           ("detached", [s for s in starts if s >= cutoff and s in _detached])):
+        if not purged:
+            continue
+        dst_cur.execute(
+            f"DELETE FROM stg_transactions WHERE date_trunc('{PARTITION_UNIT}', ts) = ANY(%s)", (purged,)
+        )
+        ROWS_SKIPPED.labels(source_name, reason).inc(dst_cur.rowcount)
+        print(f"[{source_name}] {dst_cur.rowcount} rows skipped, period {reason}")
+        starts = [s for s in starts if s not in purged]
+    attached = attached_partitions(dst_cur)
+    missing = [start for start in starts if partition_bounds(start)[0] not in attached]
+    if missing:
+        raise MissingPartitions(missing)
+
+def copy_batch(dst_cur, rows, source_name=""):
+    # COPY dans une table de staging puis INSERT ... SELECT : un seul aller-retour par batch
+    dst_cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS stg_transactions
+        (id BIGINT, iface VARCHAR(10), ts TIMESTAMP, status VARCHAR(16), amount NUMERIC(12,2))
+    """)
+    dst_cur.execute("TRUNCATE stg_transactions")
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    dst_cur.copy_expert(
+        "COPY stg_transactions (id, iface, ts, status, amount) FROM STDIN WITH (FORMAT csv)", buf
+    )
+    check_partitions(dst_cur, source_name)
+    # Seules les lignes réellement insérées alimentent les rollups (rejeu sans double comptage)
+    # ts fait partie de la clé de partition : les lignes sans ts ne sont pas chargées
+    dst_cur.execute(f"""
+        WITH ins AS (
+            INSERT INTO fact_transactions(id, iface, ts, status, amount, etl_loaded_at)
+            SELECT id, iface, ts, status, amount, now() FROM stg_transactions WHERE ts IS NOT NULL
+            ON CONFLICT (id, ts) DO NOTHING
+            RETURNING iface, ts, status, amount
+        ),
+        by_minute AS ({rollup_sql("agg_transactions_minute", "minute")}),
+        by_hour AS ({rollup_sql("agg_transactions_hour", "hour")}),
+        totals AS ({totals_sql("agg_transactions_total")}),
+        by_sketch AS ({sketch_sql("agg_amount_sketch_hour", "hour")})
+        SELECT count(*) FROM ins
+    """)
+    return dst_cur.fetchone()[0]
+
+def rollup_sql(table, unit):
+    return f"""
+        INSERT INTO {table} AS a (bucket, iface, status, tx_count, amount_sum, amount_min, amount_max)
+        SELECT date_trunc('{unit}', ts), COALESCE(iface, ''), COALESCE(status, ''),
+               count(*), COALESCE(sum(amount), 0), min(amount), max(amount)
+        FROM ins
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (bucket, iface, status) DO UPDATE SET
+            tx_count = a.tx_count + EXCLUDED.tx_count,
+            amount_sum = a.amount_sum + EXCLUDED.amount_sum,
+            amount_min = LEAST(a.amount_min, EXCLUDED.amount_min),
+            amount_max = GREATEST(a.amount_max, EXCLUDED.amount_max)
+    """
+
+# Lignes par clé dans agg_transactions_total, choisies par connexion
+TOTALS_SHARDS = 16
+
+def totals_sql(table):
+    return f"""
+        INSERT INTO {table} AS a (shard, iface, status, tx_count, amount_sum, amount_min, amount_max)
+        SELECT pg_backend_pid() % {TOTALS_SHARDS}, COALESCE(iface, ''), COALESCE(status, ''),
+               count(*), COALESCE(sum(amount), 0), min(amount), max(amount)
+        FROM ins
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (shard, iface, status) DO UPDATE SET
+            tx_count = a.tx_count + EXCLUDED.tx_count,
+            amount_sum = a.amount_sum + EXCLUDED.amount_sum,
+            amount_min = LEAST(a.amount_min, EXCLUDED.amount_min),
+            amount_max = GREATEST(a.amount_max, EXCLUDED.amount_max)
+    """
 
-    # Lire toutes les transactions sources
-    src_cur.execute("SELECT id, iface, ts, status, amount FROM transactions")
-    rows = src_cur.fetchall()
+def sketch_sql(table, unit):
+    # Sketches fusionnables par simple somme : un compteur par (bucket, iface, indice)
+    return f"""
+        INSERT INTO {table} AS s (bucket, iface, idx, tx_count)
+        SELECT date_trunc('{unit}', ts), COALESCE(iface, ''),
+               CASE WHEN amount > 0 THEN ceil(ln(amount::float8) / {SKETCH_LN_GAMMA!r})::int
+                    ELSE {SKETCH_ZERO_INDEX} END,
+               count(*)
+        FROM ins
+        WHERE amount IS NOT NULL
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (bucket, iface, idx) DO UPDATE SET tx_count = s.tx_count + EXCLUDED.tx_count
+    """
 
-    inserted = 0
-    # Optimization: collect all existing IDs first to avoid row-by-row SELECT
-    dst_cur.execute("SELECT id FROM fact_transactions")
-    existing_ids = set(row[0] for row in dst_cur.fetchall())
+def extract(src, last_id, max_id=None):
+    # Curseur nommé (côté serveur) : les lignes arrivent par paquets de ITERSIZE
+    cur = src.cursor(name="etl_extract")
+    cur.itersize = ITERSIZE
+    cur.execute(
+        "SELECT id, iface, ts, status, amount FROM transactions"
+        " WHERE id > %s AND (%s::bigint IS NULL OR id <= %s) ORDER BY id",
+        (last_id, max_id, max_id)
+    )
+    try:
+        yield from cur
+    finally:
+        cur.close()
 
-    for r in rows:
-        if r[0] not in existing_ids:
-            dst_cur.execute("""
-                INSERT INTO fact_transactions(id, iface, ts, status, amount, etl_loaded_at)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (*r, datetime.now()))
-            inserted += 1
+def late_ids(src, dst_cur, source, last_id):
+    # Ids de la fenêtre (last_id - RESCAN_IDS, last_id] présents dans la source mais pas chargés
+    low = max(0, last_id - RESCAN_IDS)
+    if last_id == 0 or RESCAN_IDS <= 0:
+        return []
+    src_cur = src.cursor()
+    src_cur.execute(
+        "SELECT id, ts FROM transactions WHERE id > %s AND id <= %s AND ts IS NOT NULL", (low, last_id)
+    )
+    window = src_cur.fetchall()
+    src_cur.close()
+    if not window:
+        return []
+    # Bornes sur ts en plus de l'id : seules les partitions de la fenêtre sont lues
+    dst_cur.execute(
+        "SELECT id FROM fact_transactions WHERE id > %s AND id <= %s AND ts >= %s AND ts <= %s",
+        (namespaced(source, low), namespaced(source, last_id),
+         min(ts for _, ts in window), max(ts for _, ts in window))
+    )
+    loaded = {id_ & ID_MASK for (id_,) in dst_cur.fetchall()}
+    return sorted(id_ for id_, _ in window if id_ not in loaded)
 
+def extract_ids(src, ids):
+    if not ids:
+        return
+    cur = src.cursor()
+    cur.execute(
+        "SELECT id, iface, ts, status, amount FROM transactions WHERE id = ANY(%s) ORDER BY id", (ids,)
+    )
+    try:
+        yield from cur
+    finally:
+        cur.close()
+
+def transform(rows, namespace=0):
+    # Les ids de chaque source sont décalés dans leur propre espace : pas de collision entre sources
+    offset = namespace << ID_NAMESPACE_BITS
+    for id_, iface, ts, status, amount in rows:
+        if id_ > ID_MASK:
+            raise ValueError(f"source id {id_} does not fit in {ID_NAMESPACE_BITS} bits")
+        yield (offset | id_, iface, ts.isoformat() if ts else None, status, amount), ts
+
+def batches(items, size):
+    it = iter(items)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+# État de détection en mémoire, alimenté par les lignes chargées (réchauffé après redémarrage)
+# et partagé par les threads des différentes sources
+detector = anomaly.Detector()
+detector_lock = threading.Lock()
+# Lignes d'un cycle gardées pour le détecteur, qui ne les voit qu'après le commit : seules
+# les plus récentes comptent pour sa fenêtre
+DETECTOR_TAIL = 100000
+
+def load_new(src, dst, source=None):
+    source = source or SOURCES[0]
+    ensure_partitions_ahead()
+    for _ in range(3):
+        try:
+            return _load_new(src, dst, source)
+        except MissingPartitions as e:
+            # Rien n'a été validé : annuler, créer les partitions hors transaction, recommencer
+            dst.rollback()
+            src.rollback()
+            print(f"[{source['name']}] {e}, creating and retrying")
+            create_partitions(e.starts)
+    raise RuntimeError(f"[{source['name']}] partitions still missing after creation")
+
+def _load_new(src, dst, source):
+    name = source["name"]
+    dst_cur = dst.cursor()
+    started = time.perf_counter()
+
+    # Transactions au-delà du high-water mark (ids locaux à la source), plus celles sous le
+    # watermark commitées après le cycle qui l'a dépassé
+    start_id = last_id = get_watermark(dst_cur, name)
+    late = late_ids(src, dst_cur, source, start_id)
+
+    # extract -> transform -> load : au plus BATCH_SIZE lignes en mémoire
+    inserted, last_ts, loaded = 0, None, deque(maxlen=DETECTOR_TAIL)
+    extracted = extract(src, start_id)
+    try:
+        for batch in batches(itertools.chain(extract_ids(src, late), extracted), BATCH_SIZE):
+            batch = list(transform(batch, source["namespace"]))
+            inserted += copy_batch(dst_cur, [row for row, _ in batch], name)
+            loaded.extend((row[0], row[1], ts, row[3], row[4]) for row, ts in batch)
+            if batch[-1][0][0] & ID_MASK > last_id:
+                last_id, last_ts = batch[-1][0][0] & ID_MASK, batch[-1][1]
+            ROWS_EXTRACTED.labels(name).inc(len(batch))
+            BATCH_ROWS.labels(name).observe(len(batch))
+    finally:
+        # Curseur serveur fermé tant que sa transaction existe, avant un éventuel rollback
+        extracted.close()
+    if late:
+        print(f"[{name}] {len(late)} late-committed rows below the watermark")
+
+    if last_id != start_id or late:
+        # Le watermark avance dans la même transaction que l'insertion
+        set_watermark(dst_cur, name, last_id, last_ts)
+        # Délivré seulement au commit : l'API ne voit jamais de lignes non validées
+        dst_cur.execute("SELECT nextval('etl_epoch')")
+        epoch = dst_cur.fetchone()[0]
+        # Plage (from, to] des nouveaux ids, plus les ids tardifs chargés sous from
+        dst_cur.execute("SELECT pg_notify(%s, %s)", (LOADED_CHANNEL, json.dumps({
+            "source": name, "from": namespaced(source, start_id), "to": namespaced(source, last_id),
+            "late": [namespaced(source, i) for i in late] if len(late) <= LATE_NOTIFY_MAX else None,
+            "count": inserted, "epoch": epoch,
+        })))
     dst.commit()
-    print(f"{inserted} inserted lines in table fact_transactions")  # Fixed typo
+    # Détection après le commit : un cycle annulé puis rejoué ne compte pas deux fois ses lignes
+    with detector_lock:
+        alerts = detector.feed(loaded)
+    if alerts:
+        anomaly.save_alerts(dst_cur, alerts)
+        dst.commit()
+    src_cur = src.cursor()
+    src_cur.execute("SELECT COALESCE(max(id), 0) FROM transactions")
+    lag_rows = max(0, src_cur.fetchone()[0] - last_id)
+    LAG_ROWS.labels(name).set(lag_rows)
+    src_cur.close()
+    src.commit()
+    dst_cur.close()
+    elapsed = time.perf_counter() - started
+    ROWS_LOADED.labels(name).inc(inserted)
+    CYCLE_DURATION.labels(name).observe(elapsed)
+    for alert in alerts:
+        ANOMALY_ALERTS.labels(alert["iface"], alert["status"]).inc()
+        print(f"ALERT {alert['status']} on {alert['iface']}: {alert['rate']:.1%} "
+              f"(baseline {alert['baseline']:.1%}, z={alert['zscore']:.1f})")
+    if last_ts is not None:
+        LAG_SECONDS.labels(name).set((datetime.now() - last_ts).total_seconds())
+    elif lag_rows == 0:
+        LAG_SECONDS.labels(name).set(0)
+    print(f"[{name}] {inserted} inserted lines in table fact_transactions "
+          f"({inserted / elapsed:.0f} rows/s, watermark id={last_id})")
+    return inserted, last_id
 
-    src_cur.close(); dst_cur.close()
-    src.close(); dst.close()
+def etl(source=None):
+    source = source or SOURCES[0]
+    wait_for_db(source["dsn"], f"Source DB {source['name']}")
+    wait_for_db(APP_DSN, "App DB")
 
-if __name__ == "__main__":
+    src = psycopg2.connect(source["dsn"])
+    dst = psycopg2.connect(APP_DSN)
+    try:
+        load_new(src, dst, source)
+    finally:
+        src.close(); dst.close()
+
+def wait_notifications(listener, timeout):
+    # Renvoie le plus grand id notifié, ou None si rien n'est arrivé avant timeout
+    if select.select([listener], [], [], timeout) == ([], [], []):
+        return None
+    listener.poll()
+    ids = [int(n.payload) for n in listener.notifies if n.payload.isdigit()]
+    listener.notifies.clear()
+    return max(ids, default=0)
+
+def listen(source=None):
+    source = source or SOURCES[0]
+    wait_for_db(source["dsn"], f"Source DB {source['name']}")
+    wait_for_db(APP_DSN, "App DB")
+
+    # Connexions persistantes : une pour LISTEN (autocommit), une par base pour les données
+    listener = psycopg2.connect(source["dsn"])
+    listener.autocommit = True
+    listener.cursor().execute(f"LISTEN {LISTEN_CHANNEL}")
+    src = psycopg2.connect(source["dsn"])
+    dst = psycopg2.connect(APP_DSN)
+    try:
+        _, watermark = load_new(src, dst, source)  # rattrapage au démarrage
+        while True:
+            notified = wait_notifications(listener, POLL_INTERVAL)
+            if notified is not None:
+                # Flush dès MAX_BATCH lignes en attente ou après MAX_LATENCY secondes
+                deadline = time.monotonic() + MAX_LATENCY
+                while notified - watermark < MAX_BATCH:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    more = wait_notifications(listener, remaining)
+                    if more is None:
+                        break
+                    notified = max(notified, more)
+            # Sans notification pendant POLL_INTERVAL : repli en polling
+            _, watermark = load_new(src, dst, source)
+    finally:
+        listener.close(); src.close(); dst.close()
+
+def run_source(source):
+    # Boucle d'une source : ses connexions, son watermark et sa reconnexion propres. Toute
+    # erreur est journalisée puis retentée avec un délai croissant : un thread mort en
+    # silence laisserait la source sans chargement dans un processus apparemment sain
+    delay = RETRY_MIN_DELAY
     while True:
-        etl()
-        time.sleep(10)
\ No newline at end of file
+        started = time.monotonic()
+        try:
+            if ETL_MODE == "poll":
+                etl(source)
+                delay = RETRY_MIN_DELAY
+                time.sleep(POLL_INTERVAL)
+                continue
+            listen(source)
+        except OperationalError as e:
+            print(f"[{source['name']}] connection lost, reconnecting in {delay:.0f}s... {e}")
+            SOURCE_ERRORS.labels(source["name"], type(e).__name__).inc()
+        except Exception as e:
+            print(f"[{source['name']}] load failed, retrying in {delay:.0f}s: {type(e).__name__}: {e}")
+            traceback.print_exc()
+            SOURCE_ERRORS.labels(source["name"], type(e).__name__).inc()
+        # Après une longue période sans erreur, on repart du délai minimal
+        if time.monotonic() - started > RETRY_MAX_DELAY:
+            delay = RETRY_MIN_DELAY
+        time.sleep(delay)
+        delay = min(delay * 2, RETRY_MAX_DELAY)
+
+if __name__ == "__main__":
+    start_http_server(METRICS_PORT)
+    # Un thread par source : psycopg2 libère le GIL pendant les allers-retours réseau,
+    # une source lente ou en retard ne bloque pas les autres
+    threads = [threading.Thread(target=run_source, args=(source,), name=f"etl-{source['name']}", daemon=True)
+               for source in SOURCES]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
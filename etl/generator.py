@@ -1,34 +1,168 @@
-import random, time
+import argparse, json, math, os, random, threading, time
 from datetime import datetime
-import psycopg2
 from psycopg2 import OperationalError
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 
 DSN = "dbname=sourcedb user=source password=source host=postgres_source port=5432"
 
+# Répartition réaliste du trafic monétique
 ifaces = ["ATM", "POS", "VISA", "MASTERCARD"]
+iface_weights = [0.10, 0.55, 0.20, 0.15]
 statuses = ["ACCEPTED", "REJECT_TECH", "REJECT_FUNC"]
+status_weights = [0.93, 0.02, 0.05]
+# Montants log-normaux par interface (médiane ~ exp(mu))
+amount_params = {"ATM": (4.3, 0.6), "POS": (3.4, 0.9), "VISA": (3.9, 1.0), "MASTERCARD": (3.9, 1.0)}
 
-def insert_tx():
-    conn = psycopg2.connect(DSN)
-    cur = conn.cursor()
-    tx = (
-        random.choice(ifaces),
-        datetime.now(),
-        random.choice(statuses),
-        round(random.uniform(10, 500), 2)
-    )
-    cur.execute(
-        "INSERT INTO transactions (iface, ts, status, amount) VALUES (%s, %s, %s, %s)", tx
-    )
-    conn.commit()
-    cur.close(); conn.close()
+TICK = 0.05
 
-if __name__ == "__main__":
-    while True:
+def rate_factor(profile, t):
+    # Multiplicateur du TPS cible selon le profil de charge (t en secondes depuis le début)
+    if profile == "burst":
+        return 5.0 if t % 60 < 10 else 1.0
+    if profile == "diurnal":
+        hour = datetime.now().hour + datetime.now().minute / 60
+        # Creux vers 4h, pic vers 16h
+        return 0.2 + 0.8 * (1 - math.cos((hour - 4) / 24 * 2 * math.pi)) / 2
+    return 1.0
+
+def random_tx(rng):
+    iface = rng.choices(ifaces, iface_weights)[0]
+    mu, sigma = amount_params[iface]
+    amount = min(max(rng.lognormvariate(mu, sigma), 1.0), 9999.99)
+    if iface == "ATM":
+        amount = max(20, round(amount / 20) * 20)
+    return (iface, datetime.now(), rng.choices(statuses, status_weights)[0], round(amount, 2))
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows = 0
+        self.latencies = []
+
+    def record(self, rows, latency):
+        with self.lock:
+            self.rows += rows
+            self.latencies.append(latency)
+
+    def drain(self):
+        with self.lock:
+            rows, latencies = self.rows, self.latencies
+            self.rows, self.latencies = 0, []
+        return rows, latencies
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def worker(index, pool, args, stats, stop):
+    # Débit régulé par jetons : rate(t) * dt lignes dues à chaque tick, insérées en un seul INSERT multi-lignes
+    rng = random.Random(None if args.seed is None else args.seed + index)
+    rate = args.tps / args.workers
+    started = last = time.monotonic()
+    due = 0.0
+    conn = pool.getconn()
+    try:
+        while not stop.is_set():
+            now = time.monotonic()
+            due += rate * rate_factor(args.profile, now - started) * (now - last)
+            last = now
+            n = min(int(due), args.batch_size)
+            if n:
+                rows = [random_tx(rng) for _ in range(n)]
+                t0 = time.perf_counter()
+                try:
+                    with conn.cursor() as cur:
+                        execute_values(cur, "INSERT INTO transactions (iface, ts, status, amount) VALUES %s", rows)
+                    conn.commit()
+                except OperationalError as e:
+                    print("DB not ready, retrying...", e)
+                    pool.putconn(conn, close=True)
+                    conn = None
+                    while conn is None and not stop.is_set():
+                        time.sleep(5)
+                        try:
+                            conn = pool.getconn()
+                        except OperationalError:
+                            pass
+                    continue
+                stats.record(n, time.perf_counter() - t0)
+                due -= n
+            stop.wait(TICK)
+    finally:
+        if conn is not None:
+            pool.putconn(conn)
+
+def latency_percentiles(latencies):
+    return {f"p{p}": percentile(latencies, p) * 1000 for p in (50, 95, 99)}
+
+def run(args):
+    pool = None
+    while pool is None:
         try:
-            insert_tx()
-            print("Inserted transaction at", datetime.now())
-            time.sleep(2)
+            pool = ThreadedConnectionPool(args.workers, args.workers, args.dsn)
         except OperationalError as e:
             print("DB not ready, retrying...", e)
             time.sleep(5)
+
+    stats, stop = Stats(), threading.Event()
+    threads = [threading.Thread(target=worker, args=(i, pool, args, stats, stop), daemon=True)
+               for i in range(args.workers)]
+    for t in threads:
+        t.start()
+
+    started = last = time.monotonic()
+    total_rows, all_latencies = 0, []
+    try:
+        while args.duration <= 0 or last - started < args.duration:
+            remaining = args.duration - (last - started) if args.duration > 0 else args.report_every
+            time.sleep(max(0.0, min(args.report_every, remaining)))
+            now = time.monotonic()
+            rows, latencies = stats.drain()
+            total_rows += rows
+            if args.duration > 0:
+                # Seules les exécutions bornées gardent toutes les latences pour le résumé final
+                all_latencies.extend(latencies)
+            lat = latency_percentiles(latencies)
+            print(f"{datetime.now():%H:%M:%S} {rows / (now - last):.1f} TPS (target {args.tps}, {args.profile}) "
+                  f"insert latency p50={lat['p50']:.1f}ms p95={lat['p95']:.1f}ms p99={lat['p99']:.1f}ms")
+            last = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+        pool.closeall()
+
+    elapsed = time.monotonic() - started
+    summary = {
+        "target_tps": args.tps, "profile": args.profile, "workers": args.workers,
+        "batch_size": args.batch_size, "seed": args.seed, "duration_s": elapsed,
+        "rows": total_rows, "tps": total_rows / elapsed if elapsed > 0 else 0.0,
+        "latency_ms": latency_percentiles(all_latencies),
+    }
+    print(f"total: {total_rows} rows in {elapsed:.1f}s, {summary['tps']:.1f} TPS")
+    if args.report_json:
+        with open(args.report_json, "w") as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load generator for the source transactions table")
+    parser.add_argument("--dsn", default=os.getenv("GENERATOR_DSN", DSN))
+    parser.add_argument("--tps", type=float, default=float(os.getenv("GENERATOR_TPS", "0.5")))
+    parser.add_argument("--profile", choices=["constant", "burst", "diurnal"],
+                        default=os.getenv("GENERATOR_PROFILE", "constant"))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("GENERATOR_WORKERS", "1")))
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("GENERATOR_BATCH_SIZE", "500")))
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--duration", type=float, default=0, help="seconds, 0 = run forever")
+    parser.add_argument("--report-every", type=float, default=10)
+    parser.add_argument("--report-json", help="write the final summary to this file")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    run(parse_args())
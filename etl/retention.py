@@ -0,0 +1,68 @@
+import argparse, os, time
+from datetime import datetime, timedelta
+import psycopg2
+
+from etl_job import APP_DSN, PARTITION_UNIT, RETENTION_DAYS, partition_bounds, wait_for_db
+
+RETENTION_MODE = os.getenv("RETENTION_MODE", "detach")  # detach / drop / archive
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "3600"))
+
+def list_partitions(cur):
+    # (nom, début) des partitions datées attachées à fact_transactions
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'fact_transactions'::regclass
+    """)
+    fmt = "%Y%m" if PARTITION_UNIT == "month" else "%Y%m%d"
+    partitions = []
+    for (name,) in cur.fetchall():
+        suffix = name.rsplit("_p", 1)[-1]
+        try:
+            partitions.append((name, datetime.strptime(suffix, fmt)))
+        except ValueError:
+            continue
+    return sorted(partitions, key=lambda p: p[1])
+
+def expired_partitions(cur, retention_days):
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    return [(name, start) for name, start in list_partitions(cur) if partition_bounds(start)[1] <= cutoff]
+
+def detach_partition(cur, name, mode):
+    cur.execute(f"ALTER TABLE fact_transactions DETACH PARTITION {name}")
+    if mode == "drop":
+        cur.execute(f"DROP TABLE {name}")
+
+def run_retention(retention_days=RETENTION_DAYS, mode=RETENTION_MODE):
+    conn = psycopg2.connect(APP_DSN)
+    cur = conn.cursor()
+    try:
+        if mode == "archive":
+            from archive import archive_and_drop, publish_pending
+            publish_pending(cur)
+            conn.commit()
+        # Une partition par transaction : un échec n'annule pas les précédentes
+        for name, start in expired_partitions(cur, retention_days):
+            if mode == "archive":
+                # Archivée en Parquet, supprimée de la base, puis le fichier est publié
+                path, archived = archive_and_drop(conn, name, start)
+                print(f"partition {name}: {archived} rows archived to {path}")
+                continue
+            detach_partition(cur, name, mode)
+            conn.commit()
+            print(f"partition {name} {'detached' if mode == 'detach' else 'dropped'}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detach or drop fact_transactions partitions past retention")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS)
+    parser.add_argument("--mode", choices=["detach", "drop", "archive"], default=RETENTION_MODE)
+    parser.add_argument("--once", action="store_true")
+    args = parser.parse_args()
+    wait_for_db(APP_DSN, "App DB")
+    while True:
+        run_retention(args.days, args.mode)
+        if args.once:
+            break
+        time.sleep(RETENTION_INTERVAL)
@@ -0,0 +1,4 @@
+import os, sys
+
+# Les modules de l'ETL s'importent entre eux au niveau racine (etl/ est le répertoire de travail)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,78 @@
+import math, random
+from datetime import datetime, timedelta
+import pytest
+import anomaly
+
+# Trafic synthétique : TPS lignes par seconde et par interface, taux de rejet fixes hors pic
+START = datetime(2024, 1, 1)
+IFACES = ("GAB", "TPE", "WEB", "API")
+REJECT_TECH_RATE, REJECT_FUNC_RATE = 0.02, 0.05
+
+
+def traffic(seconds, tps, seed, spikes=()):
+    # spikes : (iface, début, fin en secondes, taux REJECT_TECH pendant le pic)
+    rng = random.Random(seed)
+    for s in range(seconds):
+        rows = []
+        for iface in IFACES:
+            tech = REJECT_TECH_RATE
+            for spike_iface, lo, hi, rate in spikes:
+                if iface == spike_iface and lo <= s < hi:
+                    tech = rate
+            for j in range(tps):
+                ts = START + timedelta(seconds=s, microseconds=j * 1000)
+                r = rng.random()
+                status = "REJECT_TECH" if r < tech else "REJECT_FUNC" if r < tech + REJECT_FUNC_RATE else "ACCEPTED"
+                rows.append((0, iface, ts, status, 10.0))
+        yield rows
+
+
+def run(seconds, tps, seed, spikes=()):
+    detector = anomaly.Detector()
+    alerts = []
+    for rows in traffic(seconds, tps, seed, spikes):
+        alerts += detector.feed(rows)
+    return alerts
+
+
+@pytest.mark.parametrize("n,p", [(60, 0.02), (300, 0.05), (1000, 0.3)])
+def test_binomial_sf_matches_exact_sum(n, p):
+    for k in range(0, n + 1, 7):
+        exact = sum(math.comb(n, i) * p ** i * (1 - p) ** (n - i) for i in range(k, n + 1))
+        got = anomaly.binomial_sf(k, n, p)
+        if k <= n * p:
+            assert got == 1.0
+        else:
+            assert got == pytest.approx(exact, rel=1e-4)
+
+
+@pytest.mark.parametrize("hours,tps,seed", [(10, 1, 0), (10, 1, 1), (3, 5, 2)])
+def test_no_alert_on_stationary_traffic(hours, tps, seed):
+    # Seul le bruit d'échantillonnage varie : aucune alerte attendue
+    assert run(hours * 3600, tps, seed) == []
+
+
+def test_spike_raises_one_alert_per_episode():
+    spikes = [("TPE", 5400, 5580, 0.4), ("TPE", 9000, 9180, 0.4)]
+    alerts = run(3 * 3600, 1, 3, spikes)
+    assert [(a["iface"], a["status"]) for a in alerts] == [("TPE", "REJECT_TECH")] * 2
+    # Chaque alerte tombe pendant son pic, dans les deux premières minutes
+    for alert, (_, lo, _, _) in zip(alerts, spikes):
+        delay = (alert["window_end"] - START).total_seconds() - lo
+        assert 0 < delay <= 120
+        assert alert["rate"] > alert["baseline"]
+
+
+def test_no_alert_during_warmup():
+    warmup = anomaly.WARMUP_SLOTS * anomaly.SLOT_SECONDS
+    assert run(warmup, 1, 4, [("GAB", 0, warmup, 0.5)]) == []
+
+
+def test_rows_too_old_for_the_window_are_ignored():
+    detector = anomaly.Detector()
+    for rows in traffic(600, 1, 5):
+        detector.feed(rows)
+    slot = detector.slot
+    old = START - timedelta(hours=1)
+    assert detector.feed([(0, "GAB", old, "REJECT_TECH", 1.0)] * 100) == []
+    assert detector.slot == slot